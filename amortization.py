@@ -0,0 +1,112 @@
+import math
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from money import BASIS_POINTS, mul_div
+from portfolio import MONTHLY_INTEREST_BP, DAYS_PER_MONTH, INSTALLMENT_BP
+
+# Capital (en centavos) bajo el cual el cronograma lo considera cancelado
+SETTLED_THRESHOLD = 1
+# El cronograma nunca excede este número de cuotas; la última cancela el capital restante
+MAX_INSTALLMENTS = 12
+
+PaymentSplit = namedtuple("PaymentSplit", [
+    "days_elapsed", "accrued_interest", "to_interest", "to_capital",
+    "new_capital", "new_paid", "balance", "status", "overpayment",
+])
+Installment = namedtuple("Installment", ["number", "due_date", "interest", "capital", "total", "remaining_capital"])
+
+# Formato en que el operador escribe y lee las fechas; en la base se guardan en ISO
+DISPLAY_DATE_FORMAT = "%d-%m-%Y"
+
+def parse_date(value):
+    """Parses a stored loan date (ISO, or dd-mm-yyyy as typed by the operator)."""
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        return datetime.strptime(value, DISPLAY_DATE_FORMAT).date()
+
+def format_date(value):
+    """Formats a date or a stored ISO date for display (dd-mm-yyyy)."""
+    if not value:
+        return ""
+    if isinstance(value, str):
+        value = parse_date(value)
+    return value.strftime(DISPLAY_DATE_FORMAT)
+
+def accrued_interest(loan, as_of):
+    """Simple daily interest in cents on the initial capital from creation_date up to `as_of`."""
+    days = max((as_of - parse_date(loan["creation_date"])).days, 0)
+    return days, mul_div(loan["amount_cents"] * days, MONTHLY_INTEREST_BP, BASIS_POINTS * DAYS_PER_MONTH)
+
+def split_payment(loan, payment, payment_date):
+    """
+    Splits a payment (in cents) between pending interest and capital in closed form:
+    interest accrued to `payment_date` and not yet covered is paid first,
+    the rest amortizes capital up to what is outstanding; anything above that is
+    returned as `overpayment`. Every amount in the result is in cents.
+    """
+    capital_inicial = loan["amount_cents"]
+    pagado_anterior = loan["paid_cents"]
+    capital_actual = loan["capital_cents"]
+    days, accrued = accrued_interest(loan, payment_date)
+
+    # Lo que quedaba por pagar antes de este pago menos el capital pendiente es interés pendiente
+    pendiente = capital_inicial + accrued - pagado_anterior
+    interes_pendiente = max(0, pendiente - capital_actual)
+
+    to_interest = min(payment, interes_pendiente)
+    # El capital amortizado no supera el pendiente; el resto del pago queda como excedente
+    to_capital = min(payment - to_interest, max(capital_actual, 0))
+    overpayment = payment - to_interest - to_capital
+    new_capital = max(capital_actual - to_capital, 0)
+    balance = max(pendiente - payment, 0)
+    new_paid = pagado_anterior + payment
+
+    if balance == 0 or new_capital == 0:
+        return PaymentSplit(days, accrued, to_interest, to_capital, 0, new_paid, 0, "Pagado", overpayment)
+    return PaymentSplit(days, accrued, to_interest, to_capital, new_capital, new_paid, balance, "Parcialmente Pagado", overpayment)
+
+def installments_to_settle(capital):
+    """Number of 20% declining installments until the capital (cents) drops below the settled threshold."""
+    if capital <= SETTLED_THRESHOLD:
+        return 0
+    # capital * (1 - r)^n <= umbral  =>  n = ceil(log(umbral / capital) / log(1 - r))
+    return max(1, math.ceil(math.log(SETTLED_THRESHOLD / capital) / math.log(1 - INSTALLMENT_BP / BASIS_POINTS)))
+
+def build_schedule(loan, as_of):
+    """
+    Future installment schedule: every DAYS_PER_MONTH days from the next due date,
+    20% of the remaining capital plus the period interest, all in cents. Capital
+    after k installments is computed directly as capital * (1 - r)^k, so the work
+    is bounded by MAX_INSTALLMENTS regardless of the amounts.
+    """
+    capital = loan["capital_cents"]
+    if loan["status"] == "Pagado" or capital <= 0:
+        return []
+    if loan["payment_due_date"]:
+        due = parse_date(loan["payment_due_date"])
+    else:
+        # Sin fecha de pago (alta rápida o importación con la celda vacía): un período tras el registro
+        due = parse_date(loan["creation_date"]) + timedelta(days=DAYS_PER_MONTH)
+    if due < as_of:
+        periods_late = (as_of - due).days // DAYS_PER_MONTH + 1
+        due += timedelta(days=periods_late * DAYS_PER_MONTH)
+
+    # Interés ya devengado y no cubierto por los pagos anteriores se cobra en la primera cuota
+    _, accrued = accrued_interest(loan, as_of)
+    interest_paid = loan["paid_cents"] - (loan["amount_cents"] - capital)
+    overdue_interest = max(0, accrued - interest_paid)
+    period_interest = mul_div(loan["amount_cents"], MONTHLY_INTEREST_BP, BASIS_POINTS)
+
+    count = min(installments_to_settle(capital), MAX_INSTALLMENTS)
+    factor = 1 - INSTALLMENT_BP / BASIS_POINTS
+    schedule = []
+    for k in range(1, count + 1):
+        before = round(capital * factor ** (k - 1))
+        remaining = 0 if k == count else round(capital * factor ** k)
+        interest = period_interest + (overdue_interest if k == 1 else 0)
+        to_capital = before - remaining
+        schedule.append(Installment(
+            k, due + timedelta(days=(k - 1) * DAYS_PER_MONTH), interest, to_capital, interest + to_capital, remaining,
+        ))
+    return schedule
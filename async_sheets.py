@@ -0,0 +1,85 @@
+import asyncio
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+import gspread
+from ratelimit import TokenBucket
+
+# Cuota de Sheets por usuario: 60 solicitudes por minuto
+SHEETS_REQUESTS_PER_MINUTE = int(os.getenv('SHEETS_REQUESTS_PER_MINUTE', '60'))
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+def _status_code(error):
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+class AsyncWorksheet:
+    """
+    Runs gspread Worksheet calls on a thread pool, paced by a token bucket set to the
+    Sheets quota, retrying retryable APIErrors with exponential backoff and full jitter.
+    """
+
+    def __init__(self, worksheet, requests_per_minute=SHEETS_REQUESTS_PER_MINUTE, burst=None,
+                 max_retries=5, base_delay=1.0, max_delay=32.0, executor=None):
+        self.worksheet = worksheet
+        burst = burst if burst is not None else max(1, requests_per_minute // 10)
+        # El cubo arranca lleno: en cualquier ventana de 60 s caben burst + rate * 60 llamadas,
+        # así que el ritmo sostenido se reduce para que esa suma no supere la cuota
+        rate = max(requests_per_minute - burst, 1) / 60.0
+        self.limiter = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._executor = executor or ThreadPoolExecutor(max_workers=4, thread_name_prefix="loanbot-sheets")
+        self._tasks = set()
+
+    async def call(self, method, *args, **kwargs):
+        """Calls worksheet.<method>(*args, **kwargs) off the event loop and returns its result."""
+        loop = asyncio.get_running_loop()
+        fn = getattr(self.worksheet, method)
+        attempt = 0
+        while True:
+            await self.limiter.acquire()
+            try:
+                return await loop.run_in_executor(self._executor, lambda: fn(*args, **kwargs))
+            except gspread.exceptions.APIError as e:
+                status = _status_code(e)
+                if status not in RETRYABLE_STATUS or attempt >= self.max_retries:
+                    raise
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                print(f"Sheets API {status} en {method}; reintento {attempt + 1}/{self.max_retries} en {delay:.1f}s")
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    def spawn(self, method, *args, **kwargs):
+        """Starts a call in the background so a handler does not wait for Google."""
+        task = asyncio.get_running_loop().create_task(self.call(method, *args, **kwargs))
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Error en sincronización con Google Sheets: {task.exception()}")
+
+    async def get_all_values(self):
+        return await self.call("get_all_values")
+
+    async def row_values(self, row):
+        return await self.call("row_values", row)
+
+    async def append_rows(self, values, **kwargs):
+        return await self.call("append_rows", values, **kwargs)
+
+    async def batch_update(self, data, **kwargs):
+        return await self.call("batch_update", data, **kwargs)
+
+    async def aclose(self):
+        """Waits for background calls and releases the thread pool."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._executor.shutdown(wait=True)
@@ -0,0 +1 @@
+"""Synthetic-portfolio benchmarks for the bot handlers (python -m benchmarks --help)."""
@@ -0,0 +1,185 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from database import close_db, open_db, get_db
+from benchmarks.generate import generate
+from benchmarks.harness import FakeUpdate, FakeContext
+import main
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+
+def _pick_open_loans(conn, count, rng):
+    rows = conn.execute(
+        "SELECT loan_id, client_name FROM loans WHERE status <> 'Pagado' ORDER BY id LIMIT 5000"
+    ).fetchall()
+    return [tuple(row) for row in rng.sample(rows, min(count, len(rows)))]
+
+async def _scenarios(rng, repeat):
+    """Yields (name, coroutine factory) pairs; each factory runs one handler call."""
+    samples = await get_db().read(_pick_open_loans, repeat, rng)
+
+    async def list_first_page():
+        await main.list_loans_command(FakeUpdate(), FakeContext())
+
+    async def list_next_page():
+        await main.loans_page_callback(FakeUpdate(callback_data=f"pg:lista:next:{rng.randint(1, 500)}"), FakeContext())
+
+    async def saldos():
+        await main.saldos_command(FakeUpdate(), FakeContext())
+
+    async def pay_receive_client():
+        _, client = rng.choice(samples)
+        await main.pay_receive_client(FakeUpdate(client), FakeContext(user_data={"pago": main.PaymentDraft()}))
+
+    async def pay_process_amount():
+        loan_id, _ = rng.choice(samples)
+        loan = await main.db_get_loan_by_id(loan_id)
+        draft = main.PaymentDraft(loan["client_name"], loan_id, loan["version"])
+        await main.pay_process_amount(FakeUpdate("1"), FakeContext(user_data={"pago": draft}))
+
+    async def backup():
+        await main.backup_command(FakeUpdate(), FakeContext())
+
+    return [
+        ("list_loans_command", list_first_page),
+        ("list_loans_next_page", list_next_page),
+        ("saldos_command", saldos),
+        ("pay_receive_client", pay_receive_client),
+        ("pay_process_amount", pay_process_amount),
+        ("backup_command", backup),
+    ]
+
+def _percentile(sorted_values, pct):
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+async def _measure(factory, repeat):
+    timings = []
+    tracemalloc.start()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await factory()
+        timings.append((time.perf_counter() - start) * 1000)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    timings.sort()
+    return {
+        "p50_ms": round(_percentile(timings, 50), 3),
+        "p95_ms": round(_percentile(timings, 95), 3),
+        "p99_ms": round(_percentile(timings, 99), 3),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+async def _run_size(repeat, seed, backup_repeat):
+    rng = random.Random(seed)
+    results = {}
+    for name, factory in await _scenarios(rng, repeat):
+        results[name] = await _measure(factory, backup_repeat if name == "backup_command" else repeat)
+    return results
+
+def run(sizes, repeat, workdir, seed=42, backup_repeat=3):
+    report = {}
+    for size in sizes:
+        path = os.path.join(workdir, f"bench_{size}.db")
+        if not os.path.exists(path):
+            start = time.perf_counter()
+            generate(path, size, seed=seed)
+            print(f"[{size}] cartera generada en {time.perf_counter() - start:.1f}s", file=sys.stderr)
+        else:
+            open_db(path)
+        try:
+            report[str(size)] = asyncio.run(_run_size(repeat, seed, backup_repeat))
+        finally:
+            close_db()
+    return report
+
+# Arranque en frío, en un proceso nuevo: importar main, migrar la base y armar la aplicación
+STARTUP_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.init_db()
+migrated = time.perf_counter()
+main.build_application()
+built = time.perf_counter()
+print(json.dumps({"import_main": imported - start, "init_db": migrated - imported, "build_application": built - migrated}))
+"""
+
+def measure_startup(path, repeat):
+    """Runs STARTUP_SCRIPT `repeat` times against the database at `path`; same stats layout as the handlers."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, DATABASE_NAME=path, METRICS_PORT="0")
+    env.setdefault("TELEGRAM_BOT_TOKEN", "123456:benchmark")
+    timings = {}
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], cwd=root, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        for name, seconds in json.loads(output.splitlines()[-1]).items():
+            timings.setdefault(name, []).append(seconds * 1000)
+    results = {}
+    for name, values in timings.items():
+        values.sort()
+        results[name] = {
+            "p50_ms": round(_percentile(values, 50), 3),
+            "p95_ms": round(_percentile(values, 95), 3),
+            "p99_ms": round(_percentile(values, 99), 3),
+            "peak_kb": 0,
+        }
+    return results
+
+def compare(report, baseline, tolerance):
+    """Returns the lines describing scenarios slower than baseline * (1 + tolerance)."""
+    regressions = []
+    for size, scenarios in report.items():
+        for name, stats in scenarios.items():
+            base = baseline.get(size, {}).get(name)
+            if not base:
+                continue
+            for metric in ("p50_ms", "p95_ms", "peak_kb"):
+                if base[metric] and stats[metric] > base[metric] * (1 + tolerance):
+                    regressions.append(f"{size} {name} {metric}: {base[metric]} -> {stats[metric]}")
+    return regressions
+
+def print_report(report):
+    print(f"{'loans':>8} {'handler':<22} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak KB':>10}")
+    for size, scenarios in report.items():
+        for name, stats in scenarios.items():
+            print(f"{size:>8} {name:<22} {stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9} {stats['peak_kb']:>10}")
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmark de los handlers sobre carteras sintéticas.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=50, help="llamadas por handler y tamaño")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "loanbot-bench"),
+                        help="directorio donde se guardan las bases generadas (se reutilizan)")
+    parser.add_argument("--output", help="guardar el resultado en este JSON")
+    parser.add_argument("--baseline", help="JSON de una corrida anterior para comparar")
+    parser.add_argument("--startup", action="store_true", help="medir también el arranque en frío sobre la cartera más grande")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="margen permitido frente al baseline (0.25 = 25%%)")
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    args = parse_args(sys.argv[1:])
+    os.makedirs(args.workdir, exist_ok=True)
+    report = run(args.sizes, args.repeat, args.workdir)
+    if args.startup:
+        largest = max(args.sizes)
+        report["startup"] = measure_startup(os.path.join(args.workdir, f"bench_{largest}.db"), min(args.repeat, 10))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESIÓN {line}")
+        sys.exit(1 if regressions else 0)
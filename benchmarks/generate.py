@@ -0,0 +1,93 @@
+import random
+from datetime import date, timedelta
+from database import open_db, init_db
+from ledger import replay_loans
+from money import BASIS_POINTS, mul_div
+from portfolio import MONTHLY_INTEREST_BP
+
+FIRST_NAMES = [
+    "María", "José", "Juan", "Ana", "Luis", "Carmen", "Carlos", "Rosa", "Jorge", "Lucía",
+    "Pedro", "Elena", "Miguel", "Sofía", "Diego", "Paula", "Andrés", "Valeria", "Raúl", "Gabriela",
+]
+LAST_NAMES = [
+    "García", "Rodríguez", "González", "Fernández", "López", "Martínez", "Sánchez", "Pérez",
+    "Gómez", "Martín", "Díaz", "Torres", "Ramírez", "Flores", "Vargas", "Castillo", "Rojas", "Mendoza",
+]
+OPERATORS = [("1001", "Operador Uno"), ("1002", "Operador Dos"), ("1003", "Operador Tres")]
+BATCH_SIZE = 10000
+
+def _client_pool(n_loans, rng):
+    # Aproximadamente 3 préstamos por cliente; nombres con segundo apellido para evitar colisiones
+    size = max(1, n_loans // 3)
+    return [
+        f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {rng.choice(LAST_NAMES)} {i}"
+        for i in range(size)
+    ]
+
+def _loan_rows(n_loans, today, rng):
+    clients = _client_pool(n_loans, rng)
+    for i in range(1, n_loans + 1):
+        # Pocos clientes concentran muchos préstamos (distribución tipo Pareto)
+        client = clients[min(int(rng.paretovariate(1.2)) - 1, len(clients) - 1)] if rng.random() < 0.2 else rng.choice(clients)
+        operator_id, operator_name = rng.choice(OPERATORS)
+        # Más préstamos recientes que antiguos, hasta dos años atrás
+        created = today - timedelta(days=int(rng.triangular(0, 730, 0)))
+        amount = round(rng.lognormvariate(6.5, 0.8) * 100)
+        yield (
+            f"L{operator_id}{i}", operator_id, operator_name, client, amount, mul_div(amount, MONTHLY_INTEREST_BP, BASIS_POINTS),
+            (created + timedelta(days=30)).isoformat(), "Pendiente", 0,
+            created.isoformat(), amount, created.isoformat(),
+        )
+
+def _insert_loans(conn, rows):
+    conn.executemany("""
+        INSERT INTO loans (loan_id, user_id, user_name, client_name, amount_cents, interest_cents, payment_due_date, status, paid_cents, creation_date, capital_cents, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+
+def _insert_payments(conn, rows):
+    conn.executemany("""
+        INSERT INTO payments (loan_id, payment_date, amount_cents, interest_cents, capital_cents, status_after, operator_id, operator_name)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+
+def _payment_rows(loan_ids, n_payments, today, rng):
+    for _ in range(n_payments):
+        operator_id, operator_name = rng.choice(OPERATORS)
+        amount = rng.randint(2000, 30000)
+        to_interest = round(amount * rng.uniform(0.2, 0.6))
+        yield (
+            rng.choice(loan_ids), (today - timedelta(days=rng.randint(0, 365))).isoformat(),
+            amount, to_interest, amount - to_interest, "Parcialmente Pagado", operator_id, operator_name,
+        )
+
+def _batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _finish(conn, n_loans):
+    replay_loans(conn)
+    conn.execute("UPDATE loans SET status = 'Pagado' WHERE status <> 'Pagado' AND capital_cents = 0")
+    conn.execute("UPDATE loan_sequence SET value = MAX(value, ?) WHERE name = 'loans'", (n_loans,))
+
+def generate(path, n_loans, n_payments=None, seed=42):
+    """Fills a new SQLite file at `path` with n_loans loans and n_payments ledger entries."""
+    rng = random.Random(seed)
+    today = date.today()
+    n_payments = n_loans if n_payments is None else n_payments
+    db = open_db(path)
+    init_db()
+    loan_ids = []
+    for batch in _batched(_loan_rows(n_loans, today, rng), BATCH_SIZE):
+        db.write_sync(_insert_loans, batch)
+        loan_ids.extend(row[0] for row in batch)
+    for batch in _batched(_payment_rows(loan_ids, n_payments, today, rng), BATCH_SIZE):
+        db.write_sync(_insert_payments, batch)
+    db.write_sync(_finish, n_loans)
+    return db
@@ -0,0 +1,139 @@
+from types import SimpleNamespace
+
+class FakeMessage:
+    """Stands in for telegram.Message: records replies instead of sending them."""
+
+    def __init__(self, text=""):
+        self.text = text
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+    async def reply_document(self, document=None, **kwargs):
+        # Consumir el archivo por bloques como lo haría la subida a Telegram
+        content = getattr(document, "input_file_content", b"")
+        if hasattr(content, "read"):
+            size = 0
+            for chunk in iter(lambda: content.read(64 * 1024), b""):
+                size += len(chunk)
+            self.replies.append(size)
+        else:
+            self.replies.append(len(content))
+
+class FakeCallbackQuery:
+    def __init__(self, data):
+        self.data = data
+        self.edits = []
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+    async def edit_message_text(self, text, **kwargs):
+        self.edits.append(text)
+
+class FakeUpdate:
+    """Minimal telegram.Update with the attributes the handlers in main.py read."""
+
+    def __init__(self, text="", callback_data=None, user_id=1001, full_name="Benchmark"):
+        self.message = FakeMessage(text)
+        self.callback_query = FakeCallbackQuery(callback_data) if callback_data else None
+        self.effective_user = SimpleNamespace(id=user_id, full_name=full_name)
+        self.effective_chat = SimpleNamespace(id=user_id)
+
+class FakeContext:
+    """Minimal ContextTypes.DEFAULT_TYPE: command args plus per-user/chat/bot dicts."""
+
+    def __init__(self, args=None, user_data=None):
+        self.args = args
+        self.user_data = user_data if user_data is not None else {}
+        self.chat_data = {}
+        self.bot_data = {}
+
+class FakeWorksheet:
+    """
+    In-memory stand-in for gspread.Worksheet covering the calls made by
+    google_sheets_integration. Every method call counts as one API round-trip.
+    on_send, when set, runs once inside the next append_rows/batch_update before the
+    write is applied, like something happening while the request is in flight; if it
+    raises, the request fails and nothing is written.
+    """
+
+    def __init__(self, rows=None, title="Sheet1"):
+        self.title = title
+        self.rows = [list(row) for row in (rows or [])]
+        self.calls = {}
+        self.on_send = None
+
+    def _count(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def _send(self):
+        callback, self.on_send = self.on_send, None
+        if callback is not None:
+            callback()
+
+    @property
+    def row_count(self):
+        return len(self.rows)
+
+    def get_all_values(self):
+        self._count("get_all_values")
+        return [[str(value) for value in row] for row in self.rows]
+
+    def get_all_records(self):
+        self._count("get_all_records")
+        header, *body = self.rows or [[]]
+        return [dict(zip(header, row)) for row in body]
+
+    def row_values(self, row):
+        self._count("row_values")
+        return [str(value) for value in self.rows[row - 1]] if row <= len(self.rows) else []
+
+    def find(self, query, in_column=None):
+        self._count("find")
+        for number, row in enumerate(self.rows, start=1):
+            if in_column and len(row) >= in_column and str(row[in_column - 1]) == query:
+                return SimpleNamespace(row=number, col=in_column)
+        return None
+
+    def insert_row(self, values, index=1):
+        self._count("insert_row")
+        self.rows.insert(index - 1, list(values))
+
+    def clear(self):
+        self._count("clear")
+        self.rows = []
+
+    def append_row(self, values, **kwargs):
+        return self.append_rows([values], **kwargs)
+
+    def append_rows(self, values, **kwargs):
+        self._count("append_rows")
+        self._send()
+        first = len(self.rows) + 1
+        self.rows.extend(list(row) for row in values)
+        return {"updates": {"updatedRange": f"{self.title}!A{first}:I{len(self.rows)}"}}
+
+    def batch_update(self, data, **kwargs):
+        self._count("batch_update")
+        self._send()
+        for item in data:
+            row, col = _a1_to_rowcol(item["range"])
+            for r_offset, values in enumerate(item["values"]):
+                target = row + r_offset
+                while len(self.rows) < target:
+                    self.rows.append([])
+                line = self.rows[target - 1]
+                for c_offset, value in enumerate(values):
+                    while len(line) < col + c_offset:
+                        line.append("")
+                    line[col + c_offset - 1] = value
+
+def _a1_to_rowcol(label):
+    cell = label.split("!")[-1].split(":")[0]
+    letters = "".join(ch for ch in cell if ch.isalpha())
+    col = 0
+    for ch in letters:
+        col = col * 26 + (ord(ch.upper()) - ord("A") + 1)
+    return int(cell[len(letters):]), col
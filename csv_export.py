@@ -0,0 +1,110 @@
+import csv
+import gzip
+import io
+import tempfile
+from database import counts_rows, get_db
+
+# Hasta 1 MB en memoria; por encima el buffer pasa a un archivo temporal del sistema
+SPOOL_MAX_SIZE = 1024 * 1024
+FETCH_BATCH_SIZE = 500
+
+# Encabezados legibles para las columnas conocidas; el resto usa el nombre de la columna
+COLUMN_LABELS = {
+    "id": "ID",
+    "loan_id": "Loan ID",
+    "user_id": "User ID",
+    "user_name": "User Name",
+    "client_name": "Client Name",
+    "amount": "Amount",
+    "interest": "Interest",
+    "payment_due_date": "Payment Due Date",
+    "status": "Status",
+    "paid_amount": "Paid Amount",
+    "creation_date": "Creation Date",
+    "current_capital": "Current Capital",
+    "updated_at": "Updated At",
+}
+
+def _money_sql(column):
+    # Centavos enteros -> texto decimal exacto ("1234.50"), sin pasar por float
+    return (
+        f"CASE WHEN {column} IS NULL THEN NULL ELSE printf('%s%d.%02d', "
+        f"CASE WHEN {column} < 0 THEN '-' ELSE '' END, abs({column}) / 100, abs({column}) % 100) END"
+    )
+
+# Mismo formato del respaldo de siempre: montos en unidades, con los nombres de columna originales
+EXPORT_COLUMNS = ", ".join([
+    "id", "loan_id", "user_id", "user_name", "client_name",
+    f"{_money_sql('amount_cents')} AS amount",
+    f"{_money_sql('interest_cents')} AS interest",
+    "payment_due_date", "status",
+    f"{_money_sql('paid_cents')} AS paid_amount",
+    "creation_date",
+    f"{_money_sql('capital_cents')} AS current_capital",
+    "updated_at", "version",
+])
+
+def _write_csv(conn, binary_out, since):
+    text_out = io.TextIOWrapper(binary_out, encoding="utf-8", newline="")
+    if since:
+        cursor = conn.execute(f"SELECT {EXPORT_COLUMNS} FROM loans WHERE updated_at > ? ORDER BY id", (since,))
+    else:
+        cursor = conn.execute(f"SELECT {EXPORT_COLUMNS} FROM loans ORDER BY id")
+    columns = [col[0] for col in cursor.description]
+    updated_idx = columns.index("updated_at")
+    writer = csv.writer(text_out)
+    writer.writerow([COLUMN_LABELS.get(col, col) for col in columns])
+    rows, last_change = 0, since
+    while True:
+        batch = cursor.fetchmany(FETCH_BATCH_SIZE)
+        if not batch:
+            break
+        writer.writerows(batch)
+        rows += len(batch)
+        for row in batch:
+            if row[updated_idx] and (last_change is None or row[updated_idx] > last_change):
+                last_change = row[updated_idx]
+    text_out.flush()
+    # Soltar el wrapper sin cerrar el flujo binario de debajo
+    text_out.detach()
+    return rows, last_change
+
+@counts_rows(lambda result: result[1])
+def export_loans_csv(conn, since=None, compress=False):
+    """
+    Streams the loans table into a spooled temporary file, fetchmany batch by batch.
+    Only rows changed after `since` are exported when it is given.
+    Returns (file positioned at 0, row count, newest updated_at exported).
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    try:
+        if compress:
+            with gzip.GzipFile(fileobj=spool, mode="wb") as gz:
+                rows, last_change = _write_csv(conn, gz, since)
+        else:
+            rows, last_change = _write_csv(conn, spool, since)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool, rows, last_change
+
+def _get_last_export(conn):
+    row = conn.execute("SELECT value FROM export_state WHERE name = 'loans_csv'").fetchone()
+    return row["value"] if row else None
+
+def _set_last_export(conn, last_change):
+    # Nunca retroceder la marca si dos respaldos terminan en distinto orden
+    conn.execute("""
+        INSERT INTO export_state (name, value) VALUES ('loans_csv', ?)
+        ON CONFLICT(name) DO UPDATE SET value = excluded.value WHERE excluded.value > export_state.value
+    """, (last_change,))
+
+async def export_loans(incremental=False, compress=False):
+    """Runs the export on a reader thread and records the high-water mark for incremental backups."""
+    db = get_db()
+    since = await db.read(_get_last_export) if incremental else None
+    spool, rows, last_change = await db.read(export_loans_csv, since, compress)
+    if last_change and last_change != since:
+        await db.write(_set_last_export, last_change)
+    return spool, rows
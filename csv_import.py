@@ -0,0 +1,237 @@
+import argparse
+import csv
+import gzip
+import io
+import json
+import tempfile
+from datetime import date, timedelta
+from database import OPEN_STATUSES, get_db, init_db, close_db, _allocate_loan_id
+from csv_export import COLUMN_LABELS, SPOOL_MAX_SIZE
+from amortization import parse_date
+from money import Money, parse_cents
+from portfolio import MONTHLY_INTEREST_BP
+from loan_cache import loan_cache
+
+# Filas validadas e insertadas por transacción: lotes grandes reescriben menos páginas de los índices
+IMPORT_BATCH_SIZE = 5000
+# Errores que se muestran en el mensaje; el detalle completo va en un CSV aparte
+IMPORT_ERRORS_SHOWN = 20
+STATUSES = OPEN_STATUSES + ("Pagado",)
+REQUIRED_COLUMNS = ("client_name", "amount")
+# Columnas del respaldo que no se importan: las asigna la base de datos
+IGNORED_COLUMNS = ("id", "updated_at", "version")
+
+INSERT_LOAN_SQL = """
+    INSERT INTO loans (loan_id, user_id, user_name, client_name, amount_cents, interest_cents, payment_due_date,
+                       status, paid_cents, creation_date, capital_cents, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+"""
+INSERT_PAYMENT_SQL = """
+    INSERT INTO payments (loan_id, payment_date, amount_cents, interest_cents, capital_cents, status_after, operator_id, operator_name)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def _header_map(header):
+    """Maps each known field to its column index. Accepts the backup labels or the raw column names."""
+    by_name = {label.strip().lower(): field for field, label in COLUMN_LABELS.items()}
+    by_name.update({field: field for field in COLUMN_LABELS})
+    columns = {}
+    for index, name in enumerate(header):
+        field = by_name.get(name.strip().lower())
+        if field and field not in IGNORED_COLUMNS:
+            columns.setdefault(field, index)
+    return columns
+
+def _money(text, label, allow_blank=False):
+    if not text.strip():
+        if allow_blank:
+            return None
+        raise ValueError(f"falta {label}")
+    cents = parse_cents(text)
+    if cents < 0:
+        raise ValueError(f"{label} negativo: {text}")
+    return cents
+
+def _date(text, label):
+    try:
+        return parse_date(text.strip()).isoformat()
+    except ValueError:
+        raise ValueError(f"{label} inválida: {text}") from None
+
+def parse_row(values, columns, operator_id, operator_name, today):
+    """
+    Validates one CSV row. Returns the loans INSERT parameters with loan_id None when
+    it must be generated. Missing columns take the same defaults as the conversation;
+    blank cells in present columns stay NULL. Raises ValueError with the reason.
+    """
+    def cell(field):
+        index = columns.get(field)
+        if index is None:
+            return None
+        return values[index] if index < len(values) else ""
+
+    client_name = (cell("client_name") or "").strip()
+    if not client_name:
+        raise ValueError("falta el cliente")
+    amount = _money(cell("amount") or "", "el monto")
+    if amount == 0:
+        raise ValueError("el monto debe ser positivo")
+    interest = cell("interest")
+    interest = Money(amount).apply_rate(MONTHLY_INTEREST_BP).cents if interest is None else _money(interest, "el interés", allow_blank=True)
+    creation = cell("creation_date")
+    creation = _date(creation, "Fecha de registro") if creation and creation.strip() else today.isoformat()
+    due = cell("payment_due_date")
+    if due is None:
+        due = (date.fromisoformat(creation) + timedelta(days=30)).isoformat()
+    else:
+        due = _date(due, "Fecha de pago") if due.strip() else None
+    paid = _money(cell("paid_amount") or "0", "el monto pagado")
+    status = (cell("status") or "").strip()
+    if status and status not in STATUSES:
+        raise ValueError(f"estado desconocido: {status}")
+    capital = cell("current_capital")
+    if capital is None or not capital.strip():
+        # Sin capital actual: un préstamo pagado no conserva capital, como en el libro de pagos
+        capital = 0 if status == "Pagado" else amount
+    else:
+        capital = _money(capital, "el capital actual")
+    if capital > amount:
+        raise ValueError("el capital actual supera al monto")
+    if status == "Pagado" and capital:
+        raise ValueError("estado Pagado con capital pendiente")
+    if not status:
+        status = "Pagado" if capital == 0 else ("Parcialmente Pagado" if paid else "Pendiente")
+    loan_id = (cell("loan_id") or "").strip() or None
+    user_id = (cell("user_id") or "").strip() or operator_id
+    user_name = (cell("user_name") or "").strip() or operator_name
+    return (loan_id, user_id, user_name, client_name, amount, interest, due, status, paid, creation, capital)
+
+def _import_batch(conn, rows, import_date, operator_id, operator_name):
+    """
+    Inserts one batch of validated rows with executemany. A loan with a paid amount or with
+    capital already amortized gets an opening payment in the ledger, so replaying the ledger
+    keeps the imported balances.
+    Returns ([loan IDs inserted], payments inserted, [(line, error)]).
+    """
+    explicit = {values[0] for _, values in rows if values[0]}
+    # json_each evita el límite de parámetros de SQLite en el IN
+    existing = {row[0] for row in conn.execute(
+        "SELECT loan_id FROM loans WHERE loan_id IN (SELECT value FROM json_each(?))",
+        (json.dumps(list(explicit)),),
+    )} if explicit else set()
+    loans, payments, errors, seen = [], [], [], set()
+    for line, values in rows:
+        loan_id = values[0]
+        if loan_id is None:
+            loan_id = _allocate_loan_id(conn, values[1], explicit)
+        elif loan_id in existing or loan_id in seen:
+            errors.append((line, f"el préstamo {loan_id} ya existe"))
+            continue
+        seen.add(loan_id)
+        loans.append((loan_id,) + values[1:])
+        amount, paid, status, capital = values[4], values[8], values[7], values[10]
+        to_capital = amount - capital
+        # Sin asiento, el recálculo del libro dejaría el préstamo Pendiente y con todo el capital
+        if paid or to_capital or status != "Pendiente":
+            payments.append((loan_id, import_date, paid, max(paid - to_capital, 0), to_capital, status, operator_id, operator_name))
+    conn.executemany(INSERT_LOAN_SQL, loans)
+    conn.executemany(INSERT_PAYMENT_SQL, payments)
+    return [loan[0] for loan in loans], len(payments), errors
+
+def _open_text(binary, compressed):
+    if compressed:
+        binary = gzip.GzipFile(fileobj=binary, mode="rb")
+    # utf-8-sig: Excel antepone un BOM al guardar como CSV UTF-8
+    return io.TextIOWrapper(binary, encoding="utf-8-sig", newline="")
+
+class ImportResult:
+    """Counts of an import plus the first errors and a CSV with every rejected line."""
+
+    def __init__(self):
+        self.rows = 0
+        self.loans = 0
+        self.payments = 0
+        self.error_count = 0
+        self.errors = []
+        self.error_file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        self._error_text = io.TextIOWrapper(self.error_file, encoding="utf-8", newline="")
+        self._error_writer = csv.writer(self._error_text)
+        self._error_writer.writerow(["Fila", "Error"])
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < IMPORT_ERRORS_SHOWN:
+            self.errors.append((line, message))
+        self._error_writer.writerow([line, message])
+
+    def finish(self):
+        """Leaves error_file (binary) positioned at 0, ready to be sent."""
+        self._error_text.flush()
+        self._error_text.detach()
+        self.error_file.seek(0)
+
+def import_loans_csv(binary, operator_id, operator_name, compressed=False, batch_size=IMPORT_BATCH_SIZE, today=None):
+    """
+    Streams a CSV in the /backup layout into the loans table, batch by batch, one write
+    transaction per batch, so memory stays bounded by the batch size. Blocks, so call it
+    from a worker thread. Returns an ImportResult. Raises ValueError when the header
+    lacks a required column.
+    """
+    today = today or date.today()
+    db = get_db()
+    result = ImportResult()
+    text = _open_text(binary, compressed)
+    reader = csv.reader(text)
+    batch = []
+    try:
+        header = next(reader, None)
+        columns = _header_map(header or [])
+        missing = [COLUMN_LABELS[field] for field in REQUIRED_COLUMNS if field not in columns]
+        if missing:
+            raise ValueError(f"Faltan columnas: {', '.join(missing)}")
+        for values in reader:
+            line = reader.line_num
+            if not any(value.strip() for value in values):
+                continue
+            result.rows += 1
+            try:
+                batch.append((line, parse_row(values, columns, operator_id, operator_name, today)))
+            except ValueError as e:
+                result.add_error(line, str(e))
+            if len(batch) >= batch_size:
+                _flush(db, batch, result, today, operator_id, operator_name)
+                batch = []
+    except (csv.Error, UnicodeDecodeError, EOFError, gzip.BadGzipFile) as e:
+        # El resto del archivo no se puede leer; lo ya validado sí se importa
+        result.add_error(reader.line_num + 1, f"archivo ilegible desde aquí: {e}")
+    finally:
+        text.detach()
+    if batch:
+        _flush(db, batch, result, today, operator_id, operator_name)
+    result.finish()
+    return result
+
+def _flush(db, batch, result, today, operator_id, operator_name):
+    loan_ids, payments, errors = db.write_sync(_import_batch, batch, today.isoformat(), operator_id, operator_name)
+    loan_cache.invalidate(*loan_ids)
+    result.loans += len(loan_ids)
+    result.payments += payments
+    for line, message in errors:
+        result.add_error(line, message)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Importa préstamos desde un CSV con el formato de /backup.")
+    parser.add_argument("path", help="archivo .csv o .csv.gz")
+    parser.add_argument("--user-id", default="import", help="operador asignado a las filas sin User ID")
+    parser.add_argument("--user-name", default="Importación")
+    args = parser.parse_args()
+
+    init_db()
+    try:
+        with open(args.path, "rb") as f:
+            result = import_loans_csv(f, args.user_id, args.user_name, compressed=args.path.endswith(".gz"))
+        print(f"Filas: {result.rows}, préstamos importados: {result.loans}, pagos iniciales: {result.payments}, errores: {result.error_count}")
+        for line, message in result.errors:
+            print(f"  fila {line}: {message}")
+    finally:
+        close_db()
@@ -0,0 +1,547 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from metrics import record_db
+from loan_cache import loan_cache, loan_stamp
+
+load_dotenv()
+DATABASE_NAME = os.getenv('DATABASE_NAME', 'loans.db')
+DB_READERS = int(os.getenv('DB_READERS', '4'))
+
+OPEN_STATUSES = ("Pendiente", "Parcialmente Pagado")
+_OPEN_PLACEHOLDERS = ", ".join("?" * len(OPEN_STATUSES))
+# Lo mínimo para ubicar un préstamo en la caché y saber si cambió
+LOAN_KEY_COLUMNS = "id, loan_id, version, updated_at"
+
+# Pragmas aplicados a cada conexión de larga duración
+PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=134217728",
+    "PRAGMA foreign_keys=ON",
+)
+
+class LoanClosedError(Exception):
+    """The loan is no longer open (already Pagado), so it cannot take another payment."""
+
+def connect(path, readonly=False):
+    """Opens a tuned SQLite connection. Transactions are managed explicitly."""
+    conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    if readonly:
+        conn.execute("PRAGMA query_only=ON")
+    else:
+        conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+def counts_rows(row_count):
+    """
+    Marks a read whose result is not a list of rows (a file, a totals dict): row_count(result)
+    gives the rows it actually scanned, for loanbot_db_rows_total and the slow-query log.
+    """
+    def decorate(fn):
+        fn.row_count = row_count
+        return fn
+    return decorate
+
+def _row_count(fn, result):
+    row_count = getattr(fn, "row_count", None)
+    if row_count is not None:
+        return row_count(result)
+    # Lecturas: listas de filas, o (filas, hay_más) en la paginación
+    if isinstance(result, tuple) and result and isinstance(result[0], list):
+        result = result[0]
+    if isinstance(result, list):
+        return len(result)
+    return 1 if result is not None else 0
+
+class Database:
+    """
+    Long-lived SQLite connections served off the event loop.
+    All writes go through a single writer thread (SQLite allows only one writer
+    at a time), reads are spread over a small pool of read-only connections.
+    """
+
+    def __init__(self, path, readers=DB_READERS):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="loanbot-db-writer",
+                                          initializer=self._open, initargs=(False,))
+        self._readers = ThreadPoolExecutor(max_workers=max(1, readers), thread_name_prefix="loanbot-db-reader",
+                                           initializer=self._open, initargs=(True,))
+
+    def _open(self, readonly):
+        conn = connect(self.path, readonly=readonly)
+        self._local.conn = conn
+        with self._lock:
+            self._connections.append(conn)
+
+    def _run_read(self, fn, args):
+        start = time.perf_counter()
+        try:
+            result = fn(self._local.conn, *args)
+        except Exception as e:
+            record_db(fn.__name__, "read", time.perf_counter() - start, error=e)
+            raise
+        record_db(fn.__name__, "read", time.perf_counter() - start, _row_count(fn, result))
+        return result
+
+    def _run_write(self, fn, args):
+        conn = self._local.conn
+        start = time.perf_counter()
+        changes = conn.total_changes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn, *args)
+        except BaseException as e:
+            conn.execute("ROLLBACK")
+            record_db(fn.__name__, "write", time.perf_counter() - start, error=e)
+            raise
+        conn.execute("COMMIT")
+        record_db(fn.__name__, "write", time.perf_counter() - start, conn.total_changes - changes)
+        return result
+
+    def read_sync(self, fn, *args):
+        """Runs fn(conn, *args) on a reader connection and blocks until it finishes."""
+        return self._readers.submit(self._run_read, fn, args).result()
+
+    def write_sync(self, fn, *args):
+        """Runs fn(conn, *args) inside a write transaction and blocks until it commits."""
+        return self._writer.submit(self._run_write, fn, args).result()
+
+    async def read(self, fn, *args):
+        """Awaitable version of read_sync that never blocks the event loop."""
+        return await asyncio.wrap_future(self._readers.submit(self._run_read, fn, args))
+
+    async def write(self, fn, *args):
+        """Awaitable version of write_sync that never blocks the event loop."""
+        return await asyncio.wrap_future(self._writer.submit(self._run_write, fn, args))
+
+    def close(self):
+        self._readers.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+_db = None
+
+def get_db():
+    global _db
+    if _db is None:
+        _db = Database(DATABASE_NAME)
+    return _db
+
+def open_db(path):
+    """Points the shared data layer at another database file (used by tools and benchmarks)."""
+    global _db
+    close_db()
+    _db = Database(path)
+    return _db
+
+def close_db():
+    global _db
+    loan_cache.clear()
+    if _db is not None:
+        _db.close()
+        _db = None
+
+def _column_names(conn, table):
+    return {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+def _create_schema(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS loans (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            loan_id TEXT UNIQUE,
+            user_id TEXT,
+            user_name TEXT,
+            client_name TEXT,
+            amount REAL,
+            interest REAL,
+            payment_due_date TEXT,
+            status TEXT,
+            paid_amount REAL,
+            creation_date TEXT,
+            current_capital REAL
+        )
+    """)
+    # Migración para agregar current_capital si no existe (solo en el esquema anterior a los centavos)
+    columns = _column_names(conn, "loans")
+    if "amount" in columns and "current_capital" not in columns:
+        conn.execute("ALTER TABLE loans ADD COLUMN current_capital REAL")
+
+def _create_loan_sequence(conn):
+    # Secuencia para IDs de préstamo; se inicializa por encima de cualquier ID ya emitido
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS loan_sequence (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    """)
+    conn.execute("""
+        INSERT OR IGNORE INTO loan_sequence (name, value)
+        SELECT 'loans', COALESCE(MAX(id), 0) FROM loans
+    """)
+
+def _create_change_tracking(conn):
+    # Marca de última modificación por fila, usada por los respaldos incrementales
+    if "updated_at" not in _column_names(conn, "loans"):
+        conn.execute("ALTER TABLE loans ADD COLUMN updated_at TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_loans_updated_at ON loans(updated_at)")
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_loans_touch_insert AFTER INSERT ON loans
+        WHEN NEW.updated_at IS NULL
+        BEGIN
+            UPDATE loans SET updated_at = strftime('%Y-%m-%dT%H:%M:%f', 'now') WHERE id = NEW.id;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_loans_touch_update AFTER UPDATE ON loans
+        WHEN NEW.updated_at IS OLD.updated_at
+        BEGIN
+            UPDATE loans SET updated_at = strftime('%Y-%m-%dT%H:%M:%f', 'now') WHERE id = NEW.id;
+        END
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS export_state (
+            name TEXT PRIMARY KEY,
+            value TEXT
+        )
+    """)
+
+def _create_payments(conn):
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'payments'").fetchone()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS payments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            loan_id TEXT NOT NULL,
+            payment_date TEXT,
+            amount REAL NOT NULL,
+            interest_portion REAL NOT NULL,
+            capital_portion REAL NOT NULL,
+            status_after TEXT NOT NULL,
+            operator_id TEXT,
+            operator_name TEXT,
+            created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_payments_loan_date ON payments(loan_id, payment_date)")
+    if not exists:
+        # Migración: saldo de apertura con lo ya pagado antes de existir el libro de pagos
+        conn.execute("""
+            INSERT INTO payments (loan_id, payment_date, amount, interest_portion, capital_portion, status_after, operator_name)
+            SELECT loan_id, NULL, paid_amount,
+                   paid_amount - (amount - COALESCE(current_capital, amount)),
+                   amount - COALESCE(current_capital, amount),
+                   status, 'migración'
+            FROM loans WHERE paid_amount > 0
+        """)
+
+def _create_versioning(conn):
+    # Versión por fila para control de concurrencia optimista en los pagos
+    if "version" not in _column_names(conn, "loans"):
+        conn.execute("ALTER TABLE loans ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+def _create_bot_state(conn):
+    # Persistencia de PTB: user_data y estados de conversación, una fila por clave
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS bot_state (
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (kind, key)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS conversations (
+            name TEXT NOT NULL,
+            key TEXT NOT NULL,
+            state BLOB NOT NULL,
+            PRIMARY KEY (name, key)
+        ) WITHOUT ROWID
+    """)
+
+def _migrate_money_to_cents(conn):
+    # Montos en centavos enteros: sumas exactas en SQL y sin umbrales de redondeo.
+    # SQLite no cambia el tipo de una columna, así que las tablas se reconstruyen.
+    if "amount_cents" in _column_names(conn, "loans"):
+        return
+    conn.execute("""
+        CREATE TABLE loans_cents (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            loan_id TEXT UNIQUE,
+            user_id TEXT,
+            user_name TEXT,
+            client_name TEXT,
+            amount_cents INTEGER NOT NULL,
+            interest_cents INTEGER,
+            payment_due_date TEXT,
+            status TEXT,
+            paid_cents INTEGER NOT NULL DEFAULT 0,
+            creation_date TEXT,
+            capital_cents INTEGER NOT NULL,
+            updated_at TEXT,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("""
+        INSERT INTO loans_cents (id, loan_id, user_id, user_name, client_name, amount_cents, interest_cents,
+                                 payment_due_date, status, paid_cents, creation_date, capital_cents, updated_at, version)
+        SELECT id, loan_id, user_id, user_name, client_name,
+               CAST(ROUND(COALESCE(amount, 0) * 100) AS INTEGER),
+               CAST(ROUND(interest * 100) AS INTEGER),
+               payment_due_date, status,
+               CAST(ROUND(COALESCE(paid_amount, 0) * 100) AS INTEGER),
+               creation_date,
+               CAST(ROUND(COALESCE(current_capital, amount, 0) * 100) AS INTEGER),
+               updated_at, version
+        FROM loans
+    """)
+    conn.execute("DROP TABLE loans")
+    conn.execute("ALTER TABLE loans_cents RENAME TO loans")
+    conn.execute("""
+        CREATE TABLE payments_cents (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            loan_id TEXT NOT NULL,
+            payment_date TEXT,
+            amount_cents INTEGER NOT NULL,
+            interest_cents INTEGER NOT NULL,
+            capital_cents INTEGER NOT NULL,
+            status_after TEXT NOT NULL,
+            operator_id TEXT,
+            operator_name TEXT,
+            created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+        )
+    """)
+    conn.execute("""
+        INSERT INTO payments_cents (id, loan_id, payment_date, amount_cents, interest_cents, capital_cents,
+                                    status_after, operator_id, operator_name, created_at)
+        SELECT id, loan_id, payment_date,
+               CAST(ROUND(amount * 100) AS INTEGER),
+               CAST(ROUND(interest_portion * 100) AS INTEGER),
+               CAST(ROUND(capital_portion * 100) AS INTEGER),
+               status_after, operator_id, operator_name, created_at
+        FROM payments
+    """)
+    conn.execute("DROP TABLE payments")
+    conn.execute("ALTER TABLE payments_cents RENAME TO payments")
+    # DROP TABLE se lleva índices y triggers; se vuelven a crear sobre las tablas nuevas
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_payments_loan_date ON payments(loan_id, payment_date)")
+    _create_indexes(conn)
+    _create_change_tracking(conn)
+
+def _iso_date_sql(column):
+    # dd-mm-yyyy -> yyyy-mm-dd
+    return f"substr({column}, 7, 4) || '-' || substr({column}, 4, 2) || '-' || substr({column}, 1, 2)"
+
+def _migrate_dates_to_iso(conn):
+    # Fechas ISO (yyyy-mm-dd): se ordenan como texto y permiten búsquedas por rango en los índices
+    for column in ("creation_date", "payment_due_date"):
+        conn.execute(f"UPDATE loans SET {column} = {_iso_date_sql(column)} WHERE {column} LIKE '__-__-____'")
+
+def _create_indexes(conn):
+    # loan_id ya tiene el índice implícito de UNIQUE; estos cubren el flujo de pagos.
+    # (status, client_name) también sirve como índice de status y cubre la lista de clientes.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_loans_client_status ON loans(client_name, status)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_loans_status ON loans(status, client_name)")
+    # Rangos de vencimiento ("vence esta semana", "vencidos hace más de 30 días"); requieren fechas ISO
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_loans_due_date ON loans(payment_due_date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_loans_status_due ON loans(status, payment_due_date)")
+
+# Pasos del esquema en orden. PRAGMA user_version guarda cuántos ya se aplicaron al archivo;
+# los pasos nuevos se agregan siempre al final. Todos toleran una base que ya los tenga,
+# porque los archivos anteriores a este registro empiezan en la versión 0.
+MIGRATIONS = (
+    _create_schema,
+    _create_indexes,
+    _create_loan_sequence,
+    _create_change_tracking,
+    _create_payments,
+    _create_versioning,
+    _create_bot_state,
+    _migrate_money_to_cents,
+    _migrate_dates_to_iso,
+)
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def _migrate(conn):
+    version = schema_version(conn)
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(f"La base está en la versión {version} del esquema; este código solo conoce hasta la {SCHEMA_VERSION}")
+    for step in MIGRATIONS[version:]:
+        step(conn)
+    if version < SCHEMA_VERSION:
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return version
+
+def init_db():
+    """Applies the pending migrations in a single write transaction. Returns the previous schema version."""
+    version = get_db().write_sync(_migrate)
+    if version < SCHEMA_VERSION:
+        print(f"Esquema de la base actualizado de la versión {version} a la {SCHEMA_VERSION}.")
+    return version
+
+def _add_loan(conn, loan_id, user_id, user_name, client_name, amount_cents, interest_cents, payment_due_date, status, paid_cents, creation_date):
+    conn.execute("""
+        INSERT INTO loans (loan_id, user_id, user_name, client_name, amount_cents, interest_cents, payment_due_date, status, paid_cents, creation_date, capital_cents)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (loan_id, user_id, user_name, client_name, amount_cents, interest_cents, payment_due_date, status, paid_cents, creation_date, amount_cents))
+
+def _next_loan_number(conn):
+    # Debe ejecutarse dentro de la transacción de escritura que inserta el préstamo
+    return conn.execute("UPDATE loan_sequence SET value = value + 1 WHERE name = 'loans' RETURNING value").fetchone()[0]
+
+def _allocate_loan_id(conn, user_id, reserved=()):
+    # Los préstamos importados desde CSV conservan sus IDs, que pueden ocupar números de la secuencia
+    while True:
+        loan_id = f"L{user_id}{_next_loan_number(conn)}"
+        if loan_id not in reserved and conn.execute("SELECT 1 FROM loans WHERE loan_id = ?", (loan_id,)).fetchone() is None:
+            return loan_id
+
+def _create_loan(conn, user_id, user_name, client_name, amount_cents, interest_cents, payment_due_date, status, paid_cents, creation_date):
+    loan_id = _allocate_loan_id(conn, user_id)
+    _add_loan(conn, loan_id, user_id, user_name, client_name, amount_cents, interest_cents, payment_due_date, status, paid_cents, creation_date)
+    return loan_id
+
+def _record_payment(conn, loan_id, payment_date, amount_cents, interest_cents, capital_cents, new_status, operator_id, operator_name):
+    # Saldos mantenidos de forma incremental en la misma transacción que el asiento.
+    # El UPDATE va primero: si el préstamo no existe no queda ningún asiento que revertir.
+    cursor = conn.execute("""
+        UPDATE loans SET
+            status = ?,
+            paid_cents = paid_cents + ?,
+            capital_cents = CASE WHEN ? = 'Pagado' THEN 0 ELSE MAX(capital_cents - ?, 0) END,
+            version = version + 1
+        WHERE loan_id = ?
+        RETURNING paid_cents, capital_cents
+    """, (new_status, amount_cents, new_status, capital_cents, loan_id))
+    row = cursor.fetchone()
+    if row is None:
+        raise LookupError(f"Loan {loan_id} not found")
+    conn.execute("""
+        INSERT INTO payments (loan_id, payment_date, amount_cents, interest_cents, capital_cents, status_after, operator_id, operator_name)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, (loan_id, payment_date, amount_cents, interest_cents, capital_cents, new_status, operator_id, operator_name))
+    return row["paid_cents"], row["capital_cents"]
+
+def get_loan_by_id(conn, loan_id):
+    return conn.execute("SELECT * FROM loans WHERE loan_id = ?", (loan_id,)).fetchone()
+
+def get_open_loans_for_client(conn, client_name, columns="*"):
+    return conn.execute(
+        f"SELECT {columns} FROM loans WHERE client_name = ? AND status IN ({_OPEN_PLACEHOLDERS}) ORDER BY id",
+        (client_name, *OPEN_STATUSES),
+    ).fetchall()
+
+def get_distinct_open_clients(conn):
+    rows = conn.execute(
+        f"SELECT DISTINCT client_name FROM loans WHERE status IN ({_OPEN_PLACEHOLDERS})",
+        OPEN_STATUSES,
+    ).fetchall()
+    return sorted(row["client_name"] for row in rows)
+
+def get_loans_page(conn, after_id=None, before_id=None, limit=10, status=None, client_name=None, overdue_as_of=None, due_between=None, columns="*"):
+    """
+    Keyset pagination over loans ordered by id.
+    Pass after_id to move forward or before_id to move backward. overdue_as_of is a date:
+    open loans due before it. due_between is a (first, last) pair of dates: open loans
+    due in that range. Both are range scans on idx_loans_status_due.
+    Returns (rows, has_more) where has_more refers to the direction of travel.
+    """
+    conditions, params = [], []
+    if status:
+        conditions.append("status = ?")
+        params.append(status)
+    if client_name:
+        conditions.append("client_name = ?")
+        params.append(client_name)
+    if overdue_as_of:
+        conditions.append(f"status IN ({_OPEN_PLACEHOLDERS}) AND payment_due_date < ?")
+        params.extend(OPEN_STATUSES)
+        params.append(overdue_as_of.isoformat())
+    if due_between:
+        conditions.append(f"status IN ({_OPEN_PLACEHOLDERS}) AND payment_due_date BETWEEN ? AND ?")
+        params.extend(OPEN_STATUSES)
+        params.extend(day.isoformat() for day in due_between)
+    if before_id is not None:
+        conditions.append("id < ?")
+        params.append(before_id)
+        order = "DESC"
+    else:
+        conditions.append("id > ?")
+        params.append(after_id or 0)
+        order = "ASC"
+    query = f"SELECT {columns} FROM loans WHERE {' AND '.join(conditions)} ORDER BY id {order} LIMIT ?"
+    rows = conn.execute(query, (*params, limit + 1)).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if order == "DESC":
+        rows.reverse()
+    return rows, has_more
+
+def get_loans_by_ids(conn, loan_ids):
+    return conn.execute(
+        "SELECT * FROM loans WHERE loan_id IN (SELECT value FROM json_each(?))", (json.dumps(list(loan_ids)),)
+    ).fetchall()
+
+def _cached_loans(conn, keys):
+    """
+    Loans for rows read with LOAN_KEY_COLUMNS, in the same order, as CachedLoan objects.
+    Only the loans missing from the cache or changed since they were cached are read.
+    """
+    loans, missing = loan_cache.get_many({key["loan_id"]: loan_stamp(key) for key in keys})
+    if missing:
+        for entry in loan_cache.put_many(get_loans_by_ids(conn, missing)):
+            loans[entry.loan_id] = entry
+    # Un préstamo borrado entre las dos lecturas simplemente no aparece
+    return [loans[key["loan_id"]] for key in keys if key["loan_id"] in loans]
+
+def get_cached_loans_page(conn, after_id=None, before_id=None, limit=10, status=None, client_name=None, overdue_as_of=None, due_between=None):
+    """Like get_loans_page, but only the keys are read from SQLite; the rows come from the loan cache."""
+    keys, has_more = get_loans_page(conn, after_id, before_id, limit, status, client_name, overdue_as_of, due_between, LOAN_KEY_COLUMNS)
+    return _cached_loans(conn, keys), has_more
+
+def get_cached_open_loans_for_client(conn, client_name):
+    keys = get_open_loans_for_client(conn, client_name, LOAN_KEY_COLUMNS)
+    if len(keys) > loan_cache.max_size:
+        # No caben: cada consulta desalojaría la caché entera para volver a leerlos
+        return get_open_loans_for_client(conn, client_name)
+    return _cached_loans(conn, keys)
+
+async def db_create_loan(user_id, user_name, client_name, amount_cents, interest_cents, payment_due_date, status, paid_cents, creation_date):
+    """Allocates the next loan ID and inserts the loan in one transaction. Returns the ID or None."""
+    try:
+        loan_id = await get_db().write(_create_loan, user_id, user_name, client_name, amount_cents, interest_cents, payment_due_date, status, paid_cents, creation_date)
+        loan_cache.invalidate(loan_id)
+        return loan_id
+    except Exception as e:
+        print(f"Error adding loan: {e}")
+        return None
+
+async def db_get_loan_by_id(loan_id):
+    return await get_db().read(get_loan_by_id, loan_id)
+
+async def db_get_open_loans_for_client(client_name):
+    return await get_db().read(get_cached_open_loans_for_client, client_name)
+
+async def db_get_distinct_open_clients():
+    return await get_db().read(get_distinct_open_clients)
+
+async def db_get_loans_page(after_id=None, before_id=None, limit=10, status=None, client_name=None, overdue_as_of=None, due_between=None):
+    return await get_db().read(get_cached_loans_page, after_id, before_id, limit, status, client_name, overdue_as_of, due_between)
@@ -1,8 +1,34 @@
 import json
 import os
+import tempfile
+import threading
+from datetime import datetime, timezone
 from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
+from google.auth.transport.requests import Request, AuthorizedSession
 from google.oauth2.credentials import Credentials
+import requests
+from requests.adapters import HTTPAdapter
+
+# Refrescar el token este número de segundos antes de que expire
+TOKEN_REFRESH_MARGIN = 300
+TOKEN_REFRESH_RETRY = 60
+HTTP_POOL_SIZE = 10
+
+def write_token_file(token_path, creds):
+    """Writes the token atomically: temp file in the same directory, then os.replace."""
+    directory = os.path.dirname(os.path.abspath(token_path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".token-", dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as token_file:
+            token_file.write(creds.to_json())
+            token_file.flush()
+            os.fsync(token_file.fileno())
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, token_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
 def validate_redirect_uris(json_path):
     with open(json_path, "r", encoding="utf-8") as f:
@@ -28,8 +54,7 @@ def authenticate_google(json_path, scopes, token_path, prefer_oob=True):
         if creds and creds.expired and creds.refresh_token:
             try:
                 creds.refresh(Request())
-                with open(token_path, 'w') as token_file:
-                    token_file.write(creds.to_json())
+                write_token_file(token_path, creds)
             except Exception:
                 creds = None
         if not creds or not creds.valid:
@@ -45,6 +70,99 @@ def authenticate_google(json_path, scopes, token_path, prefer_oob=True):
                 creds = flow.run_local_server(port=0)
             else:
                 raise RuntimeError("No hay redirect_uri adecuado para el flujo de autenticación.")
-            with open(token_path, 'w') as token_file:
-                token_file.write(creds.to_json())
+            write_token_file(token_path, creds)
     return creds
+
+class CredentialManager:
+    """
+    Loads OAuth credentials once and keeps them in memory, refreshing them on a
+    background timer before they expire. Exposes one AuthorizedSession with a
+    pooled HTTP adapter to be shared by every Sheets call. Token refreshes use
+    their own plain requests.Session, never the AuthorizedSession.
+    """
+
+    def __init__(self, json_path, scopes, token_path, refresh_margin=TOKEN_REFRESH_MARGIN):
+        self.json_path = json_path
+        self.scopes = scopes
+        self.token_path = token_path
+        self.refresh_margin = refresh_margin
+        self._creds = None
+        self._session = None
+        self._token_http = None
+        self._timer = None
+        self._lock = threading.RLock()
+
+    @property
+    def credentials(self):
+        with self._lock:
+            if self._creds is None:
+                self._creds = authenticate_google(self.json_path, self.scopes, self.token_path)
+                self._schedule_refresh()
+            return self._creds
+
+    @property
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                session = AuthorizedSession(self.credentials)
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount("https://", adapter)
+                self._session = session
+            return self._session
+
+    def _schedule_refresh(self, delay=None):
+        if delay is None:
+            expiry = self._creds.expiry
+            if expiry is None:
+                return  # Credenciales sin vencimiento
+            # google-auth guarda expiry como UTC sin zona horaria
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            delay = (expiry - now).total_seconds() - self.refresh_margin
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(max(delay, 0), self._refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _refresh(self):
+        with self._lock:
+            if self._timer is None:
+                return  # stop() ya se llamó
+            current = self._creds
+            if self._token_http is None:
+                # No se usa la AuthorizedSession como transporte: con credenciales vencidas
+                # intentaría refrescarlas a su vez desde este hilo y sin el lock
+                self._token_http = requests.Session()
+                self._token_http.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            token_http = self._token_http
+        # La llamada al servidor de tokens se hace fuera del lock sobre una copia, así quien
+        # pida credentials o session no queda esperando a Google; luego se reemplaza bajo el lock
+        creds = Credentials.from_authorized_user_info(json.loads(current.to_json()), self.scopes)
+        try:
+            creds.refresh(Request(token_http))
+            write_token_file(self.token_path, creds)
+        except Exception as e:
+            print(f"Error refrescando el token de Google: {e}")
+            with self._lock:
+                if self._timer is not None:
+                    self._schedule_refresh(TOKEN_REFRESH_RETRY)
+            return
+        with self._lock:
+            if self._timer is None:
+                return
+            self._creds = creds
+            if self._session is not None:
+                self._session.credentials = creds
+            self._schedule_refresh()
+
+    def stop(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+            if self._token_http is not None:
+                self._token_http.close()
+                self._token_http = None
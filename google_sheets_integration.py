@@ -1,30 +1,53 @@
+import asyncio
 import gspread
 import os
+import re
+import threading
 from dotenv import load_dotenv
-from google_oauth_utils import authenticate_google
+from async_sheets import AsyncWorksheet
+from google_oauth_utils import CredentialManager
+from metrics import InstrumentedWorksheet
 
 load_dotenv()
 
 SCOPE = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
 HEADER = ['ID Préstamo', 'Fecha de Registro', 'Cliente', 'Capital', 'Interés', 'Fecha de Pago', 'Monto Amortizado', 'Saldo', 'Estatus']
 
+# La hoja solo distingue préstamos pagados de impagos; SQLite además separa Pendiente y Parcialmente Pagado
+SHEET_PAID_STATUS = "Pagado"
+SHEET_UNPAID_STATUS = "Impago"
+
+SYNC_FLUSH_INTERVAL = float(os.getenv('SHEETS_SYNC_FLUSH_INTERVAL', '5'))
+
 TOKEN_JSON_PATH = os.path.join(os.path.expanduser("~"), ".config", "gspread", "loanbot_authorized_user.json")
 os.makedirs(os.path.dirname(TOKEN_JSON_PATH), exist_ok=True)
 
+# Un gestor de credenciales por archivo de secretos y una hoja por (archivo, libro, pestaña)
+_credential_managers = {}
+_worksheets = {}
+
+def get_credential_manager(oauth_creds_file_path):
+    if oauth_creds_file_path not in _credential_managers:
+        _credential_managers[oauth_creds_file_path] = CredentialManager(oauth_creds_file_path, SCOPE, TOKEN_JSON_PATH)
+    return _credential_managers[oauth_creds_file_path]
+
 def init_gspread_client(oauth_creds_file_path, sheet_name, worksheet_name):
-    """Initializes and returns the gspread client and worksheet using OAuth2.0."""
+    """
+    Initializes and returns the gspread worksheet using OAuth2.0.
+    Credentials, HTTP session and the header check are done once per worksheet and reused.
+    """
+    key = (oauth_creds_file_path, sheet_name, worksheet_name)
+    if key in _worksheets:
+        return _worksheets[key]
     try:
-        creds = authenticate_google(
-            oauth_creds_file_path,
-            SCOPE,
-            TOKEN_JSON_PATH,
-            prefer_oob=True  # Cambia a False si prefieres el flujo local
-        )
+        manager = get_credential_manager(oauth_creds_file_path)
         print("Inicializando cliente gspread con las credenciales obtenidas...")
-        gc = gspread.Client(auth=creds)
+        gc = gspread.Client(auth=manager.credentials, session=manager.session)
         spreadsheet = gc.open(sheet_name)
-        worksheet = spreadsheet.worksheet(worksheet_name)
+        # Cada llamada a la hoja queda medida en /metrics
+        worksheet = InstrumentedWorksheet(spreadsheet.worksheet(worksheet_name))
         ensure_header(worksheet)
+        _worksheets[key] = worksheet
         print("Cliente de Google Sheets (OAuth) inicializado correctamente.")
         return worksheet
     except Exception as e:
@@ -92,6 +115,25 @@ def add_loan_to_sheet(worksheet, loan_data):
         print(f"Error adding loan to Google Sheet: {e}")
         return False
 
+def apply_payment(capital, interest, current_amortized_amount, payment_amount):
+    """Returns (new_total_amortized_amount, new_balance, new_status) after a payment."""
+    new_total_amortized_amount = current_amortized_amount + float(payment_amount)
+
+    # Saldo = (Capital + Interés) - Monto Amortizado Total
+    new_balance = (capital + interest) - new_total_amortized_amount
+
+    # Determine new status based on the new balance
+    if new_balance <= 0:
+        new_status = SHEET_PAID_STATUS
+        new_balance = 0 # Ensure balance doesn't go negative in sheet for "Pagado"
+    else:
+        new_status = SHEET_UNPAID_STATUS
+    return new_total_amortized_amount, new_balance, new_status
+
+def sheet_status(status):
+    """Maps a loans.status value to the sheet's Estatus vocabulary."""
+    return SHEET_PAID_STATUS if status == "Pagado" else SHEET_UNPAID_STATUS
+
 def update_loan_in_sheet(worksheet, loan_id, payment_date, payment_amount):
     """
     Updates an existing loan's payment date, amortized amount, recalculates the balance, and updates status.
@@ -120,17 +162,7 @@ def update_loan_in_sheet(worksheet, loan_id, payment_date, payment_amount):
                 print(f"Error converting financial data for loan {loan_id} to float: {e}. Row values: {current_row_values}")
                 return None
 
-            new_total_amortized_amount = current_amortized_amount + float(payment_amount)
-            
-            # Saldo = (Capital + Interés) - Monto Amortizado Total
-            new_balance = (capital + interest) - new_total_amortized_amount
-
-            # Determine new status based on the new balance
-            if new_balance <= 0:
-                new_status = "Pagado"
-                new_balance = 0 # Ensure balance doesn't go negative in sheet for "Pagado"
-            else:
-                new_status = "Impago"
+            new_total_amortized_amount, new_balance, new_status = apply_payment(capital, interest, current_amortized_amount, payment_amount)
 
             # Update specific cells
             updates = [
@@ -162,6 +194,189 @@ def get_all_loans_from_sheet(worksheet):
         print(f"Error retrieving loans from Google Sheet: {e}")
         return []
 
+def _to_float(value):
+    return float(value) if value not in (None, "") else 0.0
+
+class SheetRowIndex:
+    """
+    Local cache of the worksheet: loan ID -> row number, plus the last known values of each row.
+    Built from one get_all_values() call and kept current by SheetSyncQueue.
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.values = {}
+        self.next_row = 2  # La fila 1 es el encabezado
+
+    def load(self, worksheet):
+        all_values = worksheet.get_all_values()
+        self.rows.clear()
+        self.values.clear()
+        id_col = HEADER.index('ID Préstamo')
+        for row_number, row in enumerate(all_values[1:], start=2):
+            if len(row) > id_col and row[id_col]:
+                self.rows[str(row[id_col])] = row_number
+                self.values[str(row[id_col])] = list(row) + [""] * (len(HEADER) - len(row))
+        self.next_row = len(all_values) + 1 if all_values else 2
+        return self
+
+    def set(self, loan_id, row_number, values):
+        self.rows[loan_id] = row_number
+        self.values[loan_id] = list(values)
+        self.next_row = max(self.next_row, row_number + 1)
+
+class SheetSyncQueue:
+    """
+    Write-behind queue for the sheet. Loan additions and payment updates are coalesced
+    in memory and written with at most one append_rows and one batch_update per flush.
+    Payments are computed against the cached row values, so no find/row_values calls are needed.
+    Flushes run on the queue's own event loop thread and go through an AsyncWorksheet
+    (`api`), so they respect the Sheets quota and retry 429/5xx with backoff.
+    Works with any object exposing the gspread Worksheet methods used here.
+    """
+
+    def __init__(self, worksheet, index=None, flush_interval=SYNC_FLUSH_INTERVAL, api=None):
+        self.worksheet = worksheet
+        self.index = index or SheetRowIndex().load(worksheet)
+        self.api = api or AsyncWorksheet(worksheet)
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._flush_lock = None      # asyncio.Lock del bucle propio, creado en el primer flush
+        self._pending_adds = {}      # loan_id -> fila completa aún no enviada
+        self._pending_updates = {}   # loan_id -> {columna: valor}
+        self._flushing_adds = {}     # filas enviándose en el flush en curso
+        self._loop = None
+        self._thread = None
+        self._periodic = None
+
+    def add_loan(self, loan_data):
+        """Queues a new loan row (same layout as add_loan_to_sheet)."""
+        row = list(loan_data) + [""] * (len(HEADER) - len(loan_data))
+        with self._lock:
+            self._pending_adds[str(row[0])] = row
+
+    def update_loan(self, loan_id, payment_date, payment_amount):
+        """Queues a payment. Returns the new status, or None if the loan is unknown."""
+        loan_id = str(loan_id)
+        with self._lock:
+            row = self._pending_adds.get(loan_id) or self._flushing_adds.get(loan_id) or self.index.values.get(loan_id)
+            if row is None:
+                print(f"Loan {loan_id} not found in sheet cache for update.")
+                return None
+            new_total, new_balance, new_status = apply_payment(
+                _to_float(row[HEADER.index('Capital')]),
+                _to_float(row[HEADER.index('Interés')]),
+                _to_float(row[HEADER.index('Monto Amortizado')]),
+                payment_amount,
+            )
+            changes = {
+                'Fecha de Pago': payment_date,
+                'Monto Amortizado': new_total,
+                'Saldo': new_balance,
+                'Estatus': new_status,
+            }
+            for column, value in changes.items():
+                row[HEADER.index(column)] = value
+            if loan_id not in self._pending_adds:
+                self._pending_updates.setdefault(loan_id, {}).update(changes)
+            return new_status
+
+    def _submit(self, coroutine):
+        # El limitador y los reintentos de AsyncWorksheet viven en un solo bucle: el de la cola
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="loanbot-sheets-sync", daemon=True)
+                self._thread.start()
+            return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def flush(self):
+        """Sends everything queued: one append_rows and one batch_update at most. Blocks until done."""
+        return self._submit(self._flush_serialized()).result()
+
+    async def _flush_serialized(self):
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            return await self._flush()
+
+    async def _flush(self):
+        with self._lock:
+            adds, self._pending_adds = self._pending_adds, {}
+            self._flushing_adds = adds
+            rows_to_append = [list(row) for row in adds.values()]
+            # Las actualizaciones de filas cuyo alta sigue en curso esperan al siguiente flush
+            updates = {k: v for k, v in self._pending_updates.items() if k in self.index.rows}
+            self._pending_updates = {k: v for k, v in self._pending_updates.items() if k not in updates}
+        ok = True
+        if updates:
+            data = [
+                {'range': gspread.utils.rowcol_to_a1(self.index.rows[loan_id], HEADER.index(column) + 1), 'values': [[value]]}
+                for loan_id, changes in updates.items()
+                for column, value in changes.items()
+            ]
+            try:
+                # update_loan ya dejó index.values al día (bajo el lock); reescribirlo aquí
+                # pisaría con este envío un pago más reciente recibido mientras tanto
+                await self.api.batch_update(data)
+            except Exception as e:
+                print(f"Error flushing sheet updates: {e}")
+                ok = False
+                # Reencolar sin pisar cambios más recientes
+                with self._lock:
+                    for loan_id, changes in updates.items():
+                        self._pending_updates[loan_id] = {**changes, **self._pending_updates.get(loan_id, {})}
+        if adds:
+            try:
+                response = await self.api.append_rows(rows_to_append)
+                first_row = self._first_appended_row(response)
+                with self._lock:
+                    # Los pagos recibidos durante el envío ya están en adds y en _pending_updates
+                    for offset, (loan_id, row) in enumerate(adds.items()):
+                        self.index.set(loan_id, first_row + offset, row)
+            except Exception as e:
+                print(f"Error flushing sheet additions: {e}")
+                ok = False
+                with self._lock:
+                    self._pending_adds = {**adds, **self._pending_adds}
+        with self._lock:
+            self._flushing_adds = {}
+        return ok
+
+    def _first_appended_row(self, response):
+        updated_range = ((response or {}).get('updates') or {}).get('updatedRange', '')
+        match = re.search(r'![A-Z]+(\d+)', updated_range)
+        return int(match.group(1)) if match else self.index.next_row
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending_adds) + len(self._pending_updates)
+
+    def start(self):
+        """Flushes every flush_interval seconds on the queue's event loop thread."""
+        if self._periodic is None:
+            self._periodic = self._submit(self._run())
+        return self
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if self.pending():
+                # shield: cancelar el ciclo en stop() no corta un envío a medias
+                await asyncio.shield(self._flush_serialized())
+
+    def stop(self):
+        """Stops the periodic flush, sends whatever is still queued and closes the event loop thread."""
+        if self._periodic is not None:
+            self._periodic.cancel()
+            self._periodic = None
+        self.flush()
+        self._submit(self.api.aclose()).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = self._thread = None
+
 # Example usage (optional, for testing this module directly)
 if __name__ == '__main__':
     # For direct testing, you'd need to provide these or load from .env
@@ -0,0 +1,82 @@
+import sys
+from amortization import split_payment
+from database import OPEN_STATUSES, LoanClosedError, get_db, init_db, close_db, get_loan_by_id, _record_payment
+from loan_cache import loan_cache
+
+# Recalcula los saldos a partir del libro de pagos; un solo UPDATE apoyado en idx_payments_loan_date.
+# status_after es el estado tras aplicar cada asiento, así que manda el último registrado (id),
+# no el de fecha más reciente: un pago con fecha atrasada se aplica sobre el saldo vigente.
+REPLAY_SQL = """
+    UPDATE loans SET
+        paid_cents = COALESCE((SELECT SUM(p.amount_cents) FROM payments p WHERE p.loan_id = loans.loan_id), 0),
+        status = COALESCE((
+            SELECT p.status_after FROM payments p WHERE p.loan_id = loans.loan_id
+            ORDER BY p.id DESC LIMIT 1
+        ), 'Pendiente'),
+        capital_cents = MAX(amount_cents - COALESCE((
+            SELECT SUM(p.capital_cents) FROM payments p WHERE p.loan_id = loans.loan_id
+        ), 0), 0),
+        version = version + 1
+"""
+
+def replay_loans(conn, loan_ids=None):
+    """Rebuilds paid_cents, capital_cents and status from the payments ledger. Returns rows updated."""
+    scope, params = "1 = 1", ()
+    if loan_ids:
+        scope = f"loan_id IN ({', '.join('?' * len(loan_ids))})"
+        params = tuple(loan_ids)
+    updated = conn.execute(f"{REPLAY_SQL} WHERE {scope}", params).rowcount
+    # Un préstamo cerrado no conserva capital aunque el último pago haya quedado corto
+    conn.execute(f"UPDATE loans SET capital_cents = 0 WHERE status = 'Pagado' AND {scope}", params)
+    return updated
+
+def get_payments(conn, loan_id):
+    return conn.execute(
+        "SELECT * FROM payments WHERE loan_id = ? ORDER BY id", (loan_id,)
+    ).fetchall()
+
+def apply_payment(conn, loan_id, payment_cents, payment_date, expected_version=None, operator_id=None, operator_name=None):
+    """
+    Splits and records a payment against the loan as it is inside the write transaction.
+    The single writer holds BEGIN IMMEDIATE, so the row cannot change between this read
+    and the UPDATE. Returns (loan, split, stale): `stale` is True when the loan no longer
+    matched `expected_version`, the version the caller showed to the operator; the split
+    is then computed from the current balances. Raises LoanClosedError when the loan
+    was already paid off, e.g. by another payment sent from a stale conversation.
+    """
+    loan = get_loan_by_id(conn, loan_id)
+    if loan is None:
+        raise LookupError(f"Loan {loan_id} not found")
+    if loan["status"] not in OPEN_STATUSES:
+        raise LoanClosedError(f"Loan {loan_id} is {loan['status']}")
+    split = split_payment(loan, payment_cents, payment_date)
+    _record_payment(
+        conn, loan_id, payment_date.isoformat(), payment_cents, split.to_interest, split.to_capital,
+        split.status, operator_id, operator_name,
+    )
+    stale = expected_version is not None and loan["version"] != expected_version
+    return loan, split, stale
+
+async def db_apply_payment(loan_id, payment_cents, payment_date, expected_version=None, operator_id=None, operator_name=None):
+    """
+    Runs apply_payment in one BEGIN IMMEDIATE transaction. Returns (loan, split, stale),
+    or None on error. LoanClosedError is raised so the caller can tell the operator.
+    """
+    try:
+        result = await get_db().write(apply_payment, loan_id, payment_cents, payment_date, expected_version, operator_id, operator_name)
+        loan_cache.invalidate(loan_id)
+        return result
+    except LoanClosedError:
+        raise
+    except Exception as e:
+        print(f"Error recording payment: {e}")
+        return None
+
+if __name__ == '__main__':
+    # Uso: python ledger.py [ID_Préstamo ...]  (sin IDs recalcula toda la cartera)
+    init_db()
+    try:
+        updated = get_db().write_sync(replay_loans, sys.argv[1:])
+        print(f"Préstamos recalculados desde el libro de pagos: {updated}")
+    finally:
+        close_db()
@@ -0,0 +1,108 @@
+import os
+import threading
+from collections import OrderedDict
+from metrics import LOAN_CACHE_REQUESTS
+
+# Préstamos que se guardan en memoria, con sus fragmentos ya renderizados (0 desactiva la caché)
+LOAN_CACHE_SIZE = int(os.getenv('LOAN_CACHE_SIZE', '5000'))
+
+LOAN_FIELDS = (
+    "id", "loan_id", "user_id", "user_name", "client_name", "amount_cents", "interest_cents", "payment_due_date",
+    "status", "paid_cents", "creation_date", "capital_cents", "updated_at", "version",
+)
+
+class CachedLoan:
+    """Compact copy of a loans row plus its rendered message fragments. Read like a row: loan["client_name"]."""
+
+    __slots__ = LOAN_FIELDS + ("fragments",)
+
+    def __init__(self, row):
+        for field in LOAN_FIELDS:
+            setattr(self, field, row[field])
+        self.fragments = {}  # nombre -> (válido_para, texto)
+
+    def __getitem__(self, field):
+        return getattr(self, field)
+
+    @property
+    def stamp(self):
+        return self.version, self.updated_at
+
+def loan_stamp(row):
+    """What identifies one state of a loan row: version and updated_at both change on every UPDATE."""
+    return row["version"], row["updated_at"]
+
+class LoanCache:
+    """
+    LRU of CachedLoan keyed by loan_id. Lookups carry the stamp read from SQLite, so an
+    entry changed by another process or a missed invalidation is never served.
+    """
+
+    def __init__(self, max_size=LOAN_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_many(self, stamps):
+        """
+        Looks up {loan_id: stamp}. Returns ({loan_id: CachedLoan} for the entries still
+        matching their stamp, [loan_ids to read from SQLite]).
+        """
+        found, missing, stale = {}, [], 0
+        with self._lock:
+            for loan_id, stamp in stamps.items():
+                entry = self._entries.get(loan_id)
+                if entry is not None and entry.stamp == stamp:
+                    self._entries.move_to_end(loan_id)
+                    found[loan_id] = entry
+                    continue
+                if entry is not None:
+                    del self._entries[loan_id]
+                    stale += 1
+                missing.append(loan_id)
+        # Un solo incremento por consulta, no por préstamo
+        LOAN_CACHE_REQUESTS.inc("hit", amount=len(found))
+        LOAN_CACHE_REQUESTS.inc("miss", amount=len(missing) - stale)
+        LOAN_CACHE_REQUESTS.inc("stale", amount=stale)
+        return found, missing
+
+    def put_many(self, rows):
+        """Caches loans rows and returns their CachedLoan objects (not kept when the cache is disabled)."""
+        entries = [CachedLoan(row) for row in rows]
+        if self.max_size <= 0:
+            return entries
+        with self._lock:
+            for entry in entries:
+                self._entries[entry.loan_id] = entry
+                self._entries.move_to_end(entry.loan_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return entries
+
+    def invalidate(self, *loan_ids):
+        with self._lock:
+            for loan_id in loan_ids:
+                self._entries.pop(loan_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+loan_cache = LoanCache()
+
+def cached_fragments(loans, name, render, valid_for=None):
+    """
+    One fragment per loan, rendered with render(loans) -> [text] only for the loans whose
+    `name` fragment is missing or was rendered for another `valid_for` (e.g. another day).
+    Plain rows (lists too long to cache) are rendered every time.
+    """
+    if loans and not isinstance(loans[0], CachedLoan):
+        return render(loans)
+    missing = [loan for loan in loans if name not in loan.fragments or loan.fragments[name][0] != valid_for]
+    if missing:
+        for loan, text in zip(missing, render(missing)):
+            loan.fragments[name] = (valid_for, text)
+    return [loan.fragments[name][1] for loan in loans]
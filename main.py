@@ -1,98 +1,32 @@
+import asyncio
 import logging
 import os
-import sqlite3
-import csv
-from datetime import datetime, timedelta
+import html
+import tempfile
+from datetime import date, datetime, timedelta
 from dotenv import load_dotenv
-from telegram import Update, InputFile, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
-from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, ContextTypes, filters, ConversationHandler
+from telegram import Update, InputFile, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters, ConversationHandler
+from database import (
+    OPEN_STATUSES, LoanClosedError, init_db, close_db, db_create_loan,
+    db_get_loan_by_id, db_get_open_loans_for_client, db_get_distinct_open_clients, db_get_loans_page,
+)
+from csv_export import SPOOL_MAX_SIZE, export_loans
+from csv_import import import_loans_csv
+from portfolio import MONTHLY_INTEREST_BP, portfolio_from_loans, compute_balances, get_portfolio_summary
+from amortization import DISPLAY_DATE_FORMAT, build_schedule, format_date, parse_date
+from ledger import db_apply_payment
+from money import Money, format_cents
+from persistence import LoanDraft, PaymentDraft, SQLitePersistence, active_conversations
+from metrics import instrument_application, register_gauge, start_metrics_server
+from loan_cache import cached_fragments, loan_cache
+from profiling import PROFILE_MAX_SECONDS, PROFILE_ON_START, HandlerProfiler
+from reminders import schedule_reminders
+from snapshots import schedule_snapshots
 
 load_dotenv()
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
-DATABASE_NAME = os.getenv('DATABASE_NAME', 'loans.db')
-
-def get_db_connection():
-    conn = sqlite3.connect(DATABASE_NAME)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def init_db():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS loans (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            loan_id TEXT UNIQUE,
-            user_id TEXT,
-            user_name TEXT,
-            client_name TEXT,
-            amount REAL,
-            interest REAL,
-            payment_due_date TEXT,
-            status TEXT,
-            paid_amount REAL,
-            creation_date TEXT,
-            current_capital REAL
-        )
-    """)
-    # Migración para agregar current_capital si no existe
-    try:
-        cursor.execute("ALTER TABLE loans ADD COLUMN current_capital REAL")
-    except sqlite3.OperationalError:
-        pass  # Ya existe
-    conn.commit()
-    conn.close()
-
-def db_add_loan(loan_id, user_id, user_name, client_name, amount, interest, payment_due_date, status, paid_amount, creation_date):
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO loans (loan_id, user_id, user_name, client_name, amount, interest, payment_due_date, status, paid_amount, creation_date, current_capital)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (loan_id, user_id, user_name, client_name, amount, interest, payment_due_date, status, paid_amount, creation_date, amount))
-        conn.commit()
-        conn.close()
-        return True
-    except Exception as e:
-        print(f"Error adding loan: {e}")
-        return False
-
-def db_update_loan_status_and_capital(loan_id, new_status, new_paid_amount, new_current_capital):
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            UPDATE loans SET status = ?, paid_amount = ?, current_capital = ? WHERE loan_id = ?
-        """, (new_status, new_paid_amount, new_current_capital, loan_id))
-        conn.commit()
-        conn.close()
-        return True
-    except Exception as e:
-        print(f"Error updating loan: {e}")
-        return False
-
-def db_update_loan_status(loan_id, new_status, new_paid_amount):
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            UPDATE loans SET status = ?, paid_amount = ? WHERE loan_id = ?
-        """, (new_status, new_paid_amount, loan_id))
-        conn.commit()
-        conn.close()
-        return True
-    except Exception as e:
-        print(f"Error updating loan: {e}")
-        return False
-
-def db_get_all_loans():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM loans")
-    rows = cursor.fetchall()
-    conn.close()
-    return rows
+TELEGRAM_ADMIN_ID = os.getenv('TELEGRAM_ADMIN_ID')
 
 MAIN_MENU = [
     [KeyboardButton("📝 Nuevo Préstamo"), KeyboardButton("💳 Pagar Cuota")],
@@ -109,7 +43,11 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "📝 /nuevoprestamo - Registrar un nuevo préstamo\n"
             "💳 /pay - Registrar un pago\n"
             "📋 /listarprestamos - Ver todos los préstamos\n"
-            "💾 /backup - Descargar respaldo en CSV\n\n"
+            "   (filtros: pendientes, parciales, pagados, vencidos [días], semana, cliente &lt;nombre&gt;)\n"
+            "💾 /backup - Descargar respaldo en CSV (opciones: incremental, gz)\n"
+            "📊 /saldos - Ver saldos con interés devengado\n"
+            "📈 /resumen - Resumen de toda la cartera\n"
+            "📅 /cronograma &lt;ID&gt; - Ver las cuotas futuras de un préstamo\n\n"
             "<b>Comandos útiles para el servicio:</b>\n"
             "<code>systemctl start loanbot.service</code> - Iniciar el bot\n"
             "<code>systemctl stop loanbot.service</code> - Detener el bot\n"
@@ -146,14 +84,13 @@ async def handle_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def new_loan_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    loan_id = f"L{user.id}{len(db_get_all_loans()) + 1}"
     borrower_id = str(user.id)
     borrower_name = user.full_name
-    amount = 1000.00
+    amount = Money.parse("1000.00")
     status = "Pendiente"
-    paid_amount = 0.00
     creation_date = "2024-07-25"
-    if db_add_loan(loan_id, borrower_id, borrower_name, amount, status, paid_amount, creation_date):
+    loan_id = await db_create_loan(borrower_id, borrower_name, borrower_name, amount.cents, None, None, status, 0, creation_date)
+    if loan_id:
         await update.message.reply_text(f"✅ Préstamo {loan_id} registrado en la base de datos.")
     else:
         await update.message.reply_text("❌ Error al registrar el préstamo.")
@@ -165,134 +102,290 @@ async def pay_loan_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("Uso: /pay <ID_Préstamo> <MontoPagado> 💳")
             return
         loan_id_to_update = args[0]
-        payment = float(args[1])
-        loans = db_get_all_loans()
-        loan = next((l for l in loans if l["loan_id"] == loan_id_to_update), None)
+        payment = Money.parse(args[1])
+        if payment.cents <= 0:
+            raise ValueError("el monto debe ser positivo")
+        loan = await db_get_loan_by_id(loan_id_to_update)
         if not loan:
             await update.message.reply_text(f"❌ Préstamo {loan_id_to_update} no encontrado.")
             return
 
-        # Convertir fecha de registro al formato dd-mm-yyyy
-        fecha_registro = datetime.strptime(loan["creation_date"], "%d-%m-%Y")
         fecha_hoy = datetime.now()
-        dias_transcurridos = (fecha_hoy - fecha_registro).days
-        if dias_transcurridos < 0:
-            dias_transcurridos = 0
-
-        interes_anual = 0.20
-        capital_inicial = loan["amount"]
-        interes_diario = (interes_anual / 365) * capital_inicial
-
-        pagado_anterior = loan["paid_amount"]
-        current_capital = loan["current_capital"] if loan["current_capital"] is not None else capital_inicial
-
-        # Calcular cuota actual (20% del capital actual)
-        cuota = round(current_capital * 0.20, 2)
-        pago_restante = payment
-        nuevo_capital = current_capital
-
-        # Amortización: si el pago es mayor a la cuota, amortiza capital
-        while pago_restante > 0 and nuevo_capital > 0:
-            cuota_actual = round(nuevo_capital * 0.20, 2)
-            if pago_restante >= cuota_actual:
-                pago_restante -= cuota_actual
-                nuevo_capital -= (payment - pago_restante - (payment - pago_restante > cuota_actual and cuota_actual or pago_restante))
-            else:
-                nuevo_capital -= pago_restante
-                pago_restante = 0
-
-        nuevo_capital = max(nuevo_capital, 0)
-
-        # Interés diario sobre el capital inicial
-        saldo = capital_inicial + (interes_diario * dias_transcurridos)
-        saldo -= pagado_anterior
-        saldo -= payment
-        saldo = max(saldo, 0)
-        nuevo_pagado = pagado_anterior + payment
-
-        if saldo <= 0 or nuevo_capital <= 0:
-            new_status = "Pagado"
-        else:
-            new_status = "Parcialmente Pagado"
-
-        if db_update_loan_status_and_capital(loan_id_to_update, new_status, nuevo_pagado, nuevo_capital):
+        capital_inicial = loan["amount_cents"]
+        user = update.effective_user
+        result = await db_apply_payment(loan_id_to_update, payment.cents, fecha_hoy.date(), loan["version"], str(user.id), user.full_name)
+        if result:
+            _, pago, _ = result
+            new_status = pago.status
+            nuevo_pagado = pago.new_paid
+            nuevo_capital = pago.new_capital
+            saldo = pago.balance
+            excedente = f"Excedente (saldo a favor del cliente): {format_cents(pago.overpayment)}\n" if pago.overpayment else ""
             await update.message.reply_text(
                 f"💰 Pago registrado para préstamo {loan_id_to_update}.\n"
-                f"Pagado total: {nuevo_pagado:.2f}\n"
-                f"Capital inicial: {capital_inicial:.2f}\n"
-                f"Capital actual: {nuevo_capital:.2f}\n"
-                f"Saldo actualizado (con interés diario): {saldo:.2f}\n"
+                f"Pagado total: {format_cents(nuevo_pagado)}\n"
+                f"Capital inicial: {format_cents(capital_inicial)}\n"
+                f"Capital actual: {format_cents(nuevo_capital)}\n"
+                f"{excedente}"
+                f"Saldo actualizado (con interés diario): {format_cents(saldo)}\n"
                 f"Estado: {new_status}"
             )
         else:
             await update.message.reply_text(f"❌ Error al actualizar el pago para {loan_id_to_update}.")
+    except LoanClosedError:
+        await update.message.reply_text(f"ℹ️ El préstamo {loan_id_to_update} ya está pagado; no se registró el pago.")
     except (IndexError, ValueError) as e:
         await update.message.reply_text(f"Error en el comando. Uso: /pay <ID_Préstamo> <MontoPagado>. Detalle: {e}")
 
 
 
-async def list_loans_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    loans = db_get_all_loans()
-    if not loans:
-        await update.message.reply_text("📋 No hay préstamos registrados.")
-        return
-    msg = "📋 <b>Préstamos registrados:</b>\n\n"
+PAGE_SIZE = 10
+
+# Filtros aceptados por /listarprestamos y /saldos
+STATUS_FILTERS = {
+    "pendientes": "Pendiente",
+    "parciales": "Parcialmente Pagado",
+    "pagados": "Pagado",
+}
+# "semana": préstamos abiertos que vencen en los próximos días
+DUE_SOON_DAYS = 7
+
+def parse_list_filters(args):
+    filtros = {}
+    args = list(args or [])
+    while args:
+        arg = args.pop(0).lower()
+        if arg in STATUS_FILTERS:
+            filtros["status"] = STATUS_FILTERS[arg]
+        elif arg == "vencidos":
+            # "vencidos 30" = con más de 30 días de atraso
+            filtros["overdue"] = int(args.pop(0)) if args and args[0].isdigit() else 0
+        elif arg == "semana":
+            filtros["due_soon"] = True
+        elif arg == "cliente" and args:
+            filtros["client_name"] = " ".join(args)
+            break
+    return filtros
+
+def render_loan_blocks(loans):
+    blocks = []
     for loan in loans:
-        capital_inicial = loan["amount"]
-        capital_actual = loan["current_capital"] if loan["current_capital"] is not None else capital_inicial
-        msg += (
-            f"🆔 {loan['loan_id']}\n"
-            f"👤 Cliente: {loan['client_name']}\n"
-            f"💵 Capital inicial: {capital_inicial}\n"
-            f"💵 Capital actual: {capital_actual}\n"
-            f"💰 Interés: {loan['interest']}\n"
-            f"📅 Fecha de registro: {loan['creation_date']}\n"
-            f"📆 Fecha de pago: {loan['payment_due_date']}\n"
+        blocks.append(
+            f"🆔 {html.escape(loan['loan_id'])}\n"
+            f"👤 Cliente: {html.escape(str(loan['client_name']))}\n"
+            f"💵 Capital inicial: {format_cents(loan['amount_cents'])}\n"
+            f"💵 Capital actual: {format_cents(loan['capital_cents'])}\n"
+            f"💰 Interés: {format_cents(loan['interest_cents'])}\n"
+            f"📅 Fecha de registro: {format_date(loan['creation_date'])}\n"
+            f"📆 Fecha de pago: {format_date(loan['payment_due_date'])}\n"
             f"🏷️ Estado: {loan['status']}\n"
-            f"💸 Pagado: {loan['paid_amount']}\n"
+            f"💸 Pagado: {format_cents(loan['paid_cents'])}\n"
             "-----------------------------\n"
         )
-    await update.message.reply_text(msg[:4096], parse_mode="HTML")
+    return blocks
+
+def render_balance_blocks(loans):
+    portfolio = portfolio_from_loans(loans)
+    saldos = compute_balances(portfolio, datetime.now().date())
+    blocks = []
+    for i, loan in enumerate(loans):
+        dias_vencido = int(saldos["days_overdue"][i])
+        blocks.append(
+            f"👤 Cliente: {html.escape(str(loan['client_name']))}\n"
+            f"💵 Capital inicial: {format_cents(portfolio.amount_cents[i])}\n"
+            f"💵 Capital actual: {format_cents(portfolio.capital_cents[i])}\n"
+            f"📈 Interés devengado: {format_cents(saldos['accrued_interest'][i])}\n"
+            f"🧾 Saldo pendiente: {format_cents(saldos['balance'][i])}\n"
+            f"💰 Próxima cuota (20%): {format_cents(saldos['next_installment'][i])}\n"
+            f"💸 Pagado: {format_cents(portfolio.paid_cents[i])}\n"
+            + (f"⏰ Días de atraso: {dias_vencido}\n" if dias_vencido else "")
+            + "-----------------------------\n"
+        )
+    return blocks
+
+# vista -> (título, mensaje si no hay datos, renderizador de la página)
+LIST_VIEWS = {
+    "lista": ("📋 <b>Préstamos registrados:</b>", "📋 No hay préstamos registrados.", render_loan_blocks),
+    "saldos": ("📊 <b>Saldos de Clientes:</b>", "📊 No hay préstamos registrados.", render_balance_blocks),
+}
+
+async def render_loans_page(vista, filtros, after_id=None, before_id=None):
+    titulo, vacio, render = LIST_VIEWS[vista]
+    hoy = date.today()
+    loans, has_more = await db_get_loans_page(
+        after_id=after_id,
+        before_id=before_id,
+        limit=PAGE_SIZE,
+        status=filtros.get("status"),
+        client_name=filtros.get("client_name"),
+        overdue_as_of=hoy - timedelta(days=filtros["overdue"]) if "overdue" in filtros else None,
+        due_between=(hoy, hoy + timedelta(days=DUE_SOON_DAYS)) if filtros.get("due_soon") else None,
+    )
+    if not loans:
+        return vacio, None
+    # Hay página anterior si retrocedemos y quedan más, o si avanzamos desde un cursor
+    has_prev = has_more if before_id is not None else bool(after_id)
+    has_next = has_more if before_id is None else True
+    botones = []
+    if has_prev:
+        botones.append(InlineKeyboardButton("⬅️ Anterior", callback_data=f"pg:{vista}:prev:{loans[0]['id']}"))
+    if has_next:
+        botones.append(InlineKeyboardButton("Siguiente ➡️", callback_data=f"pg:{vista}:next:{loans[-1]['id']}"))
+    # Los bloques quedan en la caché de préstamos; los saldos dependen del día
+    msg = "".join([f"{titulo}\n\n", *cached_fragments(loans, vista, render, hoy)])
+    return msg, InlineKeyboardMarkup([botones]) if botones else None
+
+async def send_loans_page(update: Update, context: ContextTypes.DEFAULT_TYPE, vista):
+    filtros = parse_list_filters(context.args)
+    context.user_data[f"filtros_{vista}"] = filtros
+    msg, teclado = await render_loans_page(vista, filtros)
+    await update.message.reply_text(msg, parse_mode="HTML", reply_markup=teclado)
+
+async def cronograma_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not context.args:
+        await update.message.reply_text("Uso: /cronograma <ID_Préstamo> 📅")
+        return
+    loan_id = context.args[0]
+    loan = await db_get_loan_by_id(loan_id)
+    if not loan:
+        await update.message.reply_text(f"❌ Préstamo {loan_id} no encontrado.")
+        return
+    cuotas = build_schedule(loan, datetime.now().date())
+    if not cuotas:
+        await update.message.reply_text(f"✅ El préstamo {loan_id} no tiene cuotas pendientes.")
+        return
+    lineas = [
+        f"{c.number:>2}. {format_date(c.due_date)} | Cuota: {format_cents(c.total)} "
+        f"(interés {format_cents(c.interest)} + capital {format_cents(c.capital)}) | Capital restante: {format_cents(c.remaining_capital)}"
+        for c in cuotas
+    ]
+    await update.message.reply_text(
+        f"📅 <b>Cronograma del préstamo {html.escape(loan_id)}</b>\n\n" + "\n".join(lineas),
+        parse_mode="HTML"
+    )
+
+async def list_loans_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await send_loans_page(update, context, "lista")
+
+async def loans_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    _, vista, direccion, cursor = query.data.split(":")
+    filtros = context.user_data.get(f"filtros_{vista}", {})
+    if direccion == "next":
+        msg, teclado = await render_loans_page(vista, filtros, after_id=int(cursor))
+    else:
+        msg, teclado = await render_loans_page(vista, filtros, before_id=int(cursor))
+    await query.edit_message_text(msg, parse_mode="HTML", reply_markup=teclado)
 
 async def backup_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    loans = db_get_all_loans()
-    if not loans:
-        await update.message.reply_text("No hay datos para respaldar.")
+    opciones = {arg.lower() for arg in (context.args or [])}
+    incremental = "incremental" in opciones
+    compress = "gz" in opciones
+    spool, rows = await export_loans(incremental=incremental, compress=compress)
+    with spool:
+        if not rows:
+            await update.message.reply_text("No hay cambios desde el último respaldo." if incremental else "No hay datos para respaldar.")
+            return
+        sufijo = "_incremental" if incremental else ""
+        filename = f"loans_backup{sufijo}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv" + (".gz" if compress else "")
+        await update.message.reply_document(document=InputFile(spool, filename=filename, read_file_handle=False))
+
+# Límite de descarga de archivos de la API de bots de Telegram
+MAX_IMPORT_FILE_SIZE = 20 * 1024 * 1024
+
+async def import_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    document = update.message.document
+    if document.file_size and document.file_size > MAX_IMPORT_FILE_SIZE:
+        await update.message.reply_text("❌ El archivo supera los 20 MB que permite Telegram. Usa python csv_import.py en el servidor.")
         return
-    csv_path = "loans_backup.csv"
-    with open(csv_path, "w", newline='', encoding="utf-8") as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(["ID", "Loan ID", "User ID", "User Name", "Client Name", "Amount", "Interest", "Payment Due Date", "Status", "Paid Amount", "Creation Date"])
-        for loan in loans:
-            writer.writerow([
-                loan["id"], loan["loan_id"], loan["user_id"], loan["user_name"], loan["client_name"],
-                loan["amount"], loan["interest"], loan["payment_due_date"], loan["status"], loan["paid_amount"], loan["creation_date"]
-            ])
-    with open(csv_path, "rb") as f:
-        await update.message.reply_document(document=InputFile(f, filename=csv_path))
-    os.remove(csv_path)
+    user = update.effective_user
+    await update.message.reply_text("📥 Importando préstamos...")
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as spool:
+        telegram_file = await document.get_file()
+        await telegram_file.download_to_memory(out=spool)
+        spool.seek(0)
+        try:
+            # Lectura, validación e inserción por lotes en un hilo: el bot sigue respondiendo
+            result = await asyncio.to_thread(
+                import_loans_csv, spool, str(user.id), user.full_name,
+                compressed=(document.file_name or "").lower().endswith(".gz"),
+            )
+        except ValueError as e:
+            await update.message.reply_text(f"❌ {e}. Usa el formato de /backup.")
+            return
+    with result.error_file:
+        lines = [
+            f"✅ Préstamos importados: {result.loans} de {result.rows} filas.",
+            f"💳 Pagos iniciales registrados: {result.payments}",
+        ]
+        if result.error_count:
+            lines.append(f"❌ Filas con errores: {result.error_count}")
+            lines.extend(f"  Fila {line}: {message}" for line, message in result.errors)
+            if result.error_count > len(result.errors):
+                lines.append(f"  ... y {result.error_count - len(result.errors)} más (ver archivo adjunto).")
+        await update.message.reply_text("\n".join(lines))
+        if result.error_count > len(result.errors):
+            await update.message.reply_document(document=InputFile(result.error_file, filename="errores_importacion.csv", read_file_handle=False))
 
 async def saldos_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    loans = db_get_all_loans()
-    if not loans:
+    await send_loans_page(update, context, "saldos")
+
+async def resumen_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    resumen = await get_portfolio_summary(datetime.now().date())
+    if not resumen["loans"]:
         await update.message.reply_text("📊 No hay préstamos registrados.")
         return
-    msg = "📊 <b>Saldos de Clientes:</b>\n\n"
-    for loan in loans:
-        cliente = loan["client_name"]
-        capital_inicial = loan["amount"]
-        capital_actual = loan["current_capital"] if loan["current_capital"] is not None else capital_inicial
-        pagado = loan["paid_amount"]
-        cuota_actual = round(capital_actual * 0.20, 2) if capital_actual > 0 else 0
-        msg += (
-            f"👤 Cliente: {cliente}\n"
-            f"💵 Capital inicial: {capital_inicial}\n"
-            f"💵 Capital actual: {capital_actual}\n"
-            f"💰 Próxima cuota (20%): {cuota_actual}\n"
-            f"💸 Pagado: {pagado}\n"
-            "-----------------------------\n"
-        )
-    await update.message.reply_text(msg[:4096], parse_mode="HTML")
+    await update.message.reply_text(
+        "📈 <b>Resumen de la cartera:</b>\n\n"
+        f"🧮 Préstamos: {resumen['loans']} ({resumen['open_loans']} abiertos)\n"
+        f"💵 Capital prestado: {format_cents(resumen['capital_lent'])}\n"
+        f"💵 Capital pendiente: {format_cents(resumen['current_capital'])}\n"
+        f"📈 Interés devengado: {format_cents(resumen['accrued_interest'])}\n"
+        f"🧾 Saldo pendiente: {format_cents(resumen['outstanding'])}\n"
+        f"💸 Cobrado: {format_cents(resumen['paid'])}\n"
+        f"⏰ Vencidos: {resumen['overdue_loans']} (saldo {format_cents(resumen['overdue_balance'])})",
+        parse_mode="HTML"
+    )
+
+def is_admin(user):
+    return bool(TELEGRAM_ADMIN_ID) and user is not None and str(user.id) == TELEGRAM_ADMIN_ID.strip()
+
+async def report_profile(done, bot, chat_id):
+    try:
+        path = await done
+    except Exception as e:
+        text = f"❌ Error en el perfilado: {e}"
+    else:
+        text = f"🔬 Perfilado terminado. Resultados en <code>{html.escape(path)}</code> (handlers.txt, collapsed.txt)."
+    if chat_id is None:
+        print(text)
+    else:
+        await bot.send_message(chat_id, text, parse_mode="HTML")
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update.effective_user):
+        await update.message.reply_text("⛔ Este comando es solo para el administrador.")
+        return
+    profiler = context.bot_data["profiler"]
+    arg = context.args[0].lower() if context.args else "30"
+    if arg == "stop":
+        if profiler.active:
+            profiler.stop()
+        else:
+            await update.message.reply_text("No hay un perfilado en curso.")
+        return
+    try:
+        seconds = int(arg)
+        done = profiler.start(seconds)
+    except ValueError:
+        await update.message.reply_text("Uso: /profile <segundos> o /profile stop")
+        return
+    except RuntimeError as e:
+        await update.message.reply_text(f"⚠️ {e}. Usa /profile stop para terminarlo.")
+        return
+    await update.message.reply_text(f"🔬 Perfilando los handlers durante {min(max(seconds, 1), PROFILE_MAX_SECONDS)} s...")
+    context.application.create_task(report_profile(done, context.bot, update.effective_chat.id))
 
 # Estados para el registro de préstamo
 ASK_CLIENT, ASK_AMOUNT = range(2)
@@ -304,6 +397,7 @@ PAY_SELECT_CLIENT, PAY_SELECT_LOAN, PAY_ENTER_AMOUNT, PAY_ENTER_DATE = range(10,
 
 async def new_loan_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data.clear()
+    context.user_data["prestamo"] = LoanDraft()
     await update.message.reply_text("👤 Ingresa el nombre del cliente:")
     return ASK_CLIENT
 
@@ -312,33 +406,37 @@ async def new_loan_client(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not client_name:
         await update.message.reply_text("❌ El nombre del cliente no puede estar vacío. Intenta de nuevo:")
         return ASK_CLIENT
-    context.user_data["client_name"] = client_name
+    context.user_data.setdefault("prestamo", LoanDraft()).client_name = client_name
     await update.message.reply_text("💵 Ingresa el capital del préstamo (solo números):")
     return ASK_AMOUNT
 
 async def new_loan_amount(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        amount = float(update.message.text.replace(",", "."))
-        if amount <= 0:
+        amount = Money.parse(update.message.text)
+        if amount.cents <= 0:
             raise ValueError()
-        context.user_data["amount"] = amount
+        draft = context.user_data.get("prestamo")
+        if draft is None or draft.client_name is None:
+            await update.message.reply_text("Error interno. Intenta de nuevo.")
+            return ConversationHandler.END
+        draft.amount = amount
         # Interés fijo del 20%
-        interest = round(amount * 0.20, 2)
-        context.user_data["interest"] = interest
-        # Fecha de registro automática en formato dd-mm-yyyy
-        creation_date = datetime.now().strftime("%d-%m-%Y")
-        context.user_data["creation_date"] = creation_date
-        # Fecha de pago a 30 días en formato dd-mm-yyyy
-        payment_due_date = (datetime.now() + timedelta(days=30)).strftime("%d-%m-%Y")
-        context.user_data["payment_due_date"] = payment_due_date
+        interest = amount.apply_rate(MONTHLY_INTEREST_BP)
+        draft.interest = interest
+        # Fecha de registro automática; se guarda en ISO y se muestra como dd-mm-yyyy
+        creation_date = date.today()
+        draft.creation_date = creation_date.isoformat()
+        # Fecha de pago a 30 días
+        payment_due_date = creation_date + timedelta(days=30)
+        draft.payment_due_date = payment_due_date.isoformat()
         # Confirmación
         await update.message.reply_text(
             f"Resumen del préstamo:\n"
-            f"👤 Cliente: {context.user_data['client_name']}\n"
+            f"👤 Cliente: {draft.client_name}\n"
             f"💵 Capital: {amount}\n"
             f"💰 Interés (20%): {interest}\n"
-            f"📅 Fecha de registro: {creation_date}\n"
-            f"📆 Fecha de pago: {payment_due_date}\n\n"
+            f"📅 Fecha de registro: {format_date(creation_date)}\n"
+            f"📆 Fecha de pago: {format_date(payment_due_date)}\n\n"
             f"¿Deseas guardar este préstamo? (si/no)"
         )
         return ASK_CONFIRM
@@ -349,12 +447,11 @@ async def new_loan_amount(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def pay_select_client(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    loans = db_get_all_loans()
-    clientes = list({loan["client_name"] for loan in loans if loan["status"] != "Pagado"})
+    clientes = await db_get_distinct_open_clients()
     if not clientes:
         await update.message.reply_text("No hay clientes con préstamos pendientes.")
         return ConversationHandler.END
-    context.user_data["clientes"] = clientes
+    context.user_data["pago"] = PaymentDraft()
     keyboard = [[KeyboardButton(cliente)] for cliente in clientes]
     await update.message.reply_text(
         "Selecciona el cliente que va a realizar el pago:",
@@ -362,24 +459,23 @@ async def pay_select_client(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     return PAY_SELECT_CLIENT
 
+def render_payment_lines(loans):
+    return [
+        f"ID: {loan['loan_id']} | Monto: {format_cents(loan['capital_cents'])} | Cliente: {loan['client_name']}\n"
+        for loan in loans
+    ]
+
 async def pay_receive_client(update: Update, context: ContextTypes.DEFAULT_TYPE):
     cliente = update.message.text.strip()
-    if cliente not in context.user_data.get("clientes", []):
-        await update.message.reply_text("Cliente no válido. Selecciona uno de la lista.")
-        return PAY_SELECT_CLIENT
-    context.user_data["cliente_pago"] = cliente
-    loans = db_get_all_loans()
-    prestamos_cliente = [loan for loan in loans if loan["client_name"] == cliente and loan["status"] != "Pagado"]
+    # La consulta indexada valida el cliente; no se guarda la lista en user_data
+    prestamos_cliente = await db_get_open_loans_for_client(cliente)
     if not prestamos_cliente:
-        await update.message.reply_text("No hay préstamos pendientes para este cliente.")
-        return ConversationHandler.END
-    context.user_data["prestamos_cliente"] = prestamos_cliente
+        await update.message.reply_text("Cliente no válido o sin préstamos pendientes. Selecciona uno de la lista.")
+        return PAY_SELECT_CLIENT
+    context.user_data.setdefault("pago", PaymentDraft()).client_name = cliente
     # Mostrar lista con ID, nombre y monto
-    msg = "Selecciona el préstamo a pagar:\n"
-    keyboard = []
-    for loan in prestamos_cliente:
-        msg += f"ID: {loan['loan_id']} | Monto: {loan['current_capital'] if loan['current_capital'] is not None else loan['amount']} | Cliente: {loan['client_name']}\n"
-        keyboard.append([KeyboardButton(loan["loan_id"])])
+    msg = "".join(["Selecciona el préstamo a pagar:\n", *cached_fragments(prestamos_cliente, "pago", render_payment_lines)])
+    keyboard = [[KeyboardButton(loan["loan_id"])] for loan in prestamos_cliente]
     await update.message.reply_text(
         msg,
         reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=True)
@@ -388,14 +484,18 @@ async def pay_receive_client(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 async def pay_receive_loan(update: Update, context: ContextTypes.DEFAULT_TYPE):
     loan_id = update.message.text.strip()
-    prestamos_cliente = context.user_data.get("prestamos_cliente", [])
-    loan = next((l for l in prestamos_cliente if l["loan_id"] == loan_id), None)
-    if not loan:
+    draft = context.user_data.get("pago")
+    if draft is None:
+        await update.message.reply_text("Error interno. Intenta de nuevo.")
+        return ConversationHandler.END
+    loan = await db_get_loan_by_id(loan_id)
+    if not loan or loan["client_name"] != draft.client_name or loan["status"] not in OPEN_STATUSES:
         await update.message.reply_text("ID de préstamo no válido. Selecciona uno de la lista.")
         return PAY_SELECT_LOAN
-    context.user_data["loan_pago"] = loan
+    draft.loan_id = loan_id
+    draft.version = loan["version"]
     await update.message.reply_text(
-        f"Ingrese el monto a pagar para el préstamo {loan_id} (capital actual: {loan['current_capital'] if loan['current_capital'] is not None else loan['amount']}):",
+        f"Ingrese el monto a pagar para el préstamo {loan_id} (capital actual: {format_cents(loan['capital_cents'])}):",
         reply_markup=ReplyKeyboardRemove()
     )
     # Preguntar si quiere ingresar una fecha de pago manual
@@ -411,7 +511,8 @@ async def pay_receive_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Ingresa la fecha del pago en formato dd-mm-yyyy:")
         return PAY_ENTER_AMOUNT
     else:
-        context.user_data["fecha_pago_manual"] = datetime.now().strftime("%d-%m-%Y")
+        if "pago" in context.user_data:
+            context.user_data["pago"].payment_date = date.today().isoformat()
         await update.message.reply_text("Ingresa el monto a pagar:")
         return PAY_ENTER_AMOUNT
 
@@ -419,89 +520,59 @@ async def pay_process_amount(update: Update, context: ContextTypes.DEFAULT_TYPE)
     try:
         # Si el texto es una fecha, la guardamos y pedimos el monto
         try:
-            fecha_pago = datetime.strptime(update.message.text.strip(), "%d-%m-%Y")
-            context.user_data["fecha_pago_manual"] = fecha_pago.strftime("%d-%m-%Y")
+            fecha_pago = datetime.strptime(update.message.text.strip(), DISPLAY_DATE_FORMAT).date()
+            if "pago" in context.user_data:
+                context.user_data["pago"].payment_date = fecha_pago.isoformat()
             await update.message.reply_text("Ingresa el monto a pagar:")
             return PAY_ENTER_AMOUNT
         except ValueError:
             pass  # No es fecha, entonces es monto
 
-        payment = float(update.message.text.replace(",", "."))
-        if payment <= 0:
+        payment = Money.parse(update.message.text)
+        if payment.cents <= 0:
             raise ValueError()
-        loan = context.user_data.get("loan_pago")
-        if not loan:
+        draft = context.user_data.pop("pago", None)
+        if draft is None or draft.loan_id is None:
             await update.message.reply_text("Error interno. Intenta de nuevo.")
             return ConversationHandler.END
 
-        fecha_pago_str = context.user_data.get("fecha_pago_manual", datetime.now().strftime("%d-%m-%Y"))
-        fecha_pago = datetime.strptime(fecha_pago_str, "%d-%m-%Y")
-        fecha_registro = datetime.strptime(loan["creation_date"], "%d-%m-%Y")
-        dias_transcurridos = (fecha_pago - fecha_registro).days
-        if dias_transcurridos < 0:
-            dias_transcurridos = 0
-
-        interes_mensual = 0.20
-        capital_inicial = loan["amount"]
-        # Interés diario calculado sobre el capital inicial (simple interest)
-        interes_diario_sobre_capital_inicial = (interes_mensual / 30) * capital_inicial
-
-        pagado_anterior = loan["paid_amount"]
-        current_capital_before_payment = loan["current_capital"] if loan["current_capital"] is not None else capital_inicial
-
-        # Calcular el total de interés devengado desde el inicio del préstamo hasta la fecha de pago
-        total_interes_devengado_hasta_fecha_pago = round(interes_diario_sobre_capital_inicial * dias_transcurridos, 2)
-
-        # Calcular la porción de interés que estaba pendiente antes de este pago,
-        # considerando los pagos anteriores.
-        # Deuda total teórica (capital + interés total devengado)
-        deuda_total_teorica = capital_inicial + total_interes_devengado_hasta_fecha_pago
-        # Lo que quedaba por pagar antes de este pago actual
-        pendiente_antes_de_pago_actual = deuda_total_teorica - pagado_anterior
-        
-        # Interés pendiente de cubrir antes de este pago actual
-        # Esto es la diferencia entre lo pendiente total y el capital actual pendiente (principal)
-        interes_pendiente_a_cubrir = round(max(0, pendiente_antes_de_pago_actual - current_capital_before_payment), 2)
-
-        # Aplicar el pago:
-        pago_a_interes = min(payment, interes_pendiente_a_cubrir)
-        pago_a_capital = round(payment - pago_a_interes, 2)
-
-        if pago_a_capital < 0: # Sanity check, should not happen if interes_pendiente_a_cubrir is calculated correctly
-            pago_a_capital = 0
-            
-        nuevo_capital = round(current_capital_before_payment - pago_a_capital, 2)
-        nuevo_capital = max(0, nuevo_capital) # El capital no puede ser negativo
-
-        # Saldo con interés diario simple acumulado (20% mensual) - esta es la deuda total restante
-        saldo = round((capital_inicial + total_interes_devengado_hasta_fecha_pago) - pagado_anterior - payment, 2)
-        saldo = max(0, saldo) # El saldo no puede ser negativo
-        
-        nuevo_pagado = round(pagado_anterior + payment, 2)
-
-        if saldo <= 0.01 or nuevo_capital <= 0.01 : # Usar un pequeño umbral para comparaciones de flotantes
-            new_status = "Pagado"
-            # Asegurar que si está pagado, el saldo y capital actual sean 0 para evitar confusiones
-            saldo = 0
-            nuevo_capital = 0
-        else:
-            new_status = "Parcialmente Pagado"
-
-        if db_update_loan_status_and_capital(loan["loan_id"], new_status, nuevo_pagado, nuevo_capital):
+        fecha_pago = parse_date(draft.payment_date) if draft.payment_date else date.today()
+        user = update.effective_user
+        # El reparto se calcula dentro de la transacción con el préstamo vigente
+        result = await db_apply_payment(draft.loan_id, payment.cents, fecha_pago, draft.version, str(user.id), user.full_name)
+        if result:
+            loan, pago, stale = result
+            capital_inicial = loan["amount_cents"]
+            pago_a_interes = pago.to_interest
+            pago_a_capital = pago.to_capital
+            nuevo_capital = pago.new_capital
+            saldo = pago.balance
+            nuevo_pagado = pago.new_paid
+            new_status = pago.status
+            excedente = f"  - Excedente (saldo a favor del cliente): {format_cents(pago.overpayment)}\n" if pago.overpayment else ""
+            if stale:
+                await update.message.reply_text(
+                    "⚠️ El préstamo cambió mientras registrabas el pago (otro pago o ajuste). "
+                    "El reparto se recalculó con los saldos actuales."
+                )
             await update.message.reply_text(
                 f"💰 Pago registrado para préstamo {loan['loan_id']}.\n"
-                f"Fecha de pago: {fecha_pago_str}\n"
-                f"Monto pagado: {payment:.2f}\n"
-                f"  - Aplicado a interés: {pago_a_interes:.2f}\n"
-                f"  - Aplicado a capital: {pago_a_capital:.2f}\n"
-                f"Pagado total acumulado: {nuevo_pagado:.2f}\n"
-                f"Capital inicial: {capital_inicial:.2f}\n"
-                f"Capital actual restante: {nuevo_capital:.2f}\n"
-                f"Saldo total pendiente (incluye intereses futuros si aplica): {saldo:.2f}\n"
+                f"Fecha de pago: {format_date(fecha_pago)}\n"
+                f"Monto pagado: {payment}\n"
+                f"  - Aplicado a interés: {format_cents(pago_a_interes)}\n"
+                f"  - Aplicado a capital: {format_cents(pago_a_capital)}\n"
+                f"{excedente}"
+                f"Pagado total acumulado: {format_cents(nuevo_pagado)}\n"
+                f"Capital inicial: {format_cents(capital_inicial)}\n"
+                f"Capital actual restante: {format_cents(nuevo_capital)}\n"
+                f"Saldo total pendiente (incluye intereses futuros si aplica): {format_cents(saldo)}\n"
                 f"Estado: {new_status}"
             )
         else:
-            await update.message.reply_text(f"❌ Error al actualizar el pago para {loan['loan_id']}.")
+            await update.message.reply_text(f"❌ Error al actualizar el pago para {draft.loan_id}.")
+    except LoanClosedError:
+        # Otro pago lo liquidó mientras esta conversación seguía abierta
+        await update.message.reply_text(f"ℹ️ El préstamo {draft.loan_id} ya está pagado; no se registró el pago.")
     except Exception as e:
         await update.message.reply_text(f"Error procesando el pago: {e}")
     return ConversationHandler.END
@@ -509,44 +580,61 @@ async def pay_process_amount(update: Update, context: ContextTypes.DEFAULT_TYPE)
 async def new_loan_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = update.message.text.strip().lower()
     if text not in ["si", "sí", "s", "yes", "y"]:
+        context.user_data.pop("prestamo", None)
         await update.message.reply_text("Registro de préstamo cancelado.")
         return ConversationHandler.END
 
     user = update.effective_user
-    loans = db_get_all_loans()
-    loan_id = f"L{user.id}{len(loans) + 1}"
     borrower_id = str(user.id)
     borrower_name = user.full_name
-    client_name = context.user_data["client_name"]
-    amount = context.user_data["amount"]
-    interest = context.user_data["interest"]
-    creation_date = context.user_data["creation_date"]
-    payment_due_date = context.user_data["payment_due_date"]
+    draft = context.user_data.pop("prestamo", None)
+    if draft is None or draft.amount is None:
+        await update.message.reply_text("Error interno. Intenta de nuevo.")
+        return ConversationHandler.END
+    client_name = draft.client_name
+    amount = draft.amount
+    interest = draft.interest
+    creation_date = draft.creation_date
+    payment_due_date = draft.payment_due_date
     status = "Pendiente"
-    paid_amount = 0.0
 
-    if db_add_loan(loan_id, borrower_id, borrower_name, client_name, amount, interest, payment_due_date, status, paid_amount, creation_date):
+    loan_id = await db_create_loan(borrower_id, borrower_name, client_name, amount.cents, interest.cents, payment_due_date, status, 0, creation_date)
+    if loan_id:
         await update.message.reply_text(
             f"✅ Préstamo registrado:\n"
             f"ID: {loan_id}\n"
             f"👤 Cliente: {client_name}\n"
             f"💵 Capital: {amount}\n"
             f"💰 Interés: {interest}\n"
-            f"📅 Fecha de registro: {creation_date}\n"
-            f"📆 Fecha de pago: {payment_due_date}"
+            f"📅 Fecha de registro: {format_date(creation_date)}\n"
+            f"📆 Fecha de pago: {format_date(payment_due_date)}"
         )
     else:
         await update.message.reply_text("❌ Error al registrar el préstamo.")
     return ConversationHandler.END
 
 async def new_loan_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    context.user_data.pop("prestamo", None)
+    context.user_data.pop("pago", None)
     await update.message.reply_text("Registro de préstamo cancelado.")
     return ConversationHandler.END
 
-def main():
-    init_db()
-    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
-    application = ApplicationBuilder().token(TELEGRAM_BOT_TOKEN).build()
+async def on_startup(application):
+    if PROFILE_ON_START > 0:
+        done = application.bot_data["profiler"].start(PROFILE_ON_START)
+        application.create_task(report_profile(done, application.bot, None))
+
+async def on_shutdown(application):
+    close_db()
+
+def build_application(webhook=False):
+    # Los flujos en curso sobreviven a un reinicio: user_data y estados se guardan en SQLite
+    builder = ApplicationBuilder().token(TELEGRAM_BOT_TOKEN).persistence(SQLitePersistence()).post_init(on_startup).post_shutdown(on_shutdown)
+    if webhook:
+        from webhook import PerChatUpdateProcessor
+        # Sin updater: los updates llegan por HTTP y se procesan en paralelo, en orden por chat
+        builder = builder.updater(None).concurrent_updates(PerChatUpdateProcessor())
+    application = builder.build()
 
     application.add_handler(CommandHandler("start", start))
 
@@ -558,6 +646,8 @@ def main():
             ASK_CONFIRM: [MessageHandler(filters.TEXT & ~filters.COMMAND, new_loan_confirm)],
         },
         fallbacks=[CommandHandler("cancel", new_loan_cancel)],
+        name="nuevo_prestamo",
+        persistent=True,
     )
 
     pay_conv_handler = ConversationHandler(
@@ -569,6 +659,8 @@ def main():
             PAY_ENTER_AMOUNT: [MessageHandler(filters.TEXT & ~filters.COMMAND, pay_process_amount)],
         },
         fallbacks=[CommandHandler("cancel", new_loan_cancel)],
+        name="pagar_cuota",
+        persistent=True,
         map_to_parent={
             ConversationHandler.END: ConversationHandler.END,
         }
@@ -579,9 +671,37 @@ def main():
     application.add_handler(CommandHandler("listarprestamos", list_loans_command))
     application.add_handler(CommandHandler("backup", backup_command))
     application.add_handler(CommandHandler("saldos", saldos_command))
+    application.add_handler(CommandHandler("resumen", resumen_command))
+    application.add_handler(CommandHandler("cronograma", cronograma_command))
+    application.add_handler(CommandHandler("profile", profile_command))
+    application.add_handler(CallbackQueryHandler(loans_page_callback, pattern=r"^pg:"))
+    application.add_handler(MessageHandler(filters.Document.FileExtension("csv") | filters.Document.FileExtension("gz"), import_document))
     application.add_handler(MessageHandler(filters.TEXT & (~filters.COMMAND), handle_menu))
+    # Latencia, llamadas y errores de cada handler, incluidos los estados de las conversaciones
+    instrument_application(application)
+    register_gauge("loanbot_active_conversations", "Conversaciones en curso por flujo.", active_conversations, ("conversation",))
+    register_gauge("loanbot_loan_cache_entries", "Préstamos en la caché en memoria.", lambda: len(loan_cache))
+    # Perfilado bajo demanda (/profile o PROFILE_ON_START); apagado no añade costo
+    application.bot_data["profiler"] = HandlerProfiler()
+    if application.job_queue is not None:
+        schedule_reminders(application.job_queue)
+        schedule_snapshots(application.job_queue)
+    else:
+        print("JobQueue no disponible: instala python-telegram-bot[job-queue] para los recordatorios de vencimiento y las instantáneas de la base.")
+    return application
+
+def main():
+    init_db()
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    webhook_mode = os.getenv('BOT_MODE', 'polling').lower() == 'webhook'
+    application = build_application(webhook=webhook_mode)
+    start_metrics_server()
     print("Bot iniciado. Presiona Ctrl+C para detener.")
-    application.run_polling()
+    if webhook_mode:
+        from webhook import run_webhook
+        run_webhook(application)
+    else:
+        application.run_polling()
 
 if __name__ == '__main__':
     main()
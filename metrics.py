@@ -0,0 +1,276 @@
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+
+load_dotenv()
+# Puerto local del endpoint /metrics (formato de texto de Prometheus); 0 lo desactiva
+METRICS_LISTEN = os.getenv('METRICS_LISTEN', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+# Consultas a SQLite más lentas que esto (en ms) se registran en el log de consultas lentas
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '200'))
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+slow_query_log = logging.getLogger("loanbot.slow_query")
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic counter per label combination."""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in items:
+            yield self.name, _format_labels(self.labels, label_values), value
+
+class Histogram:
+    """Cumulative histogram with fixed buckets, as Prometheus expects."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}  # etiquetas -> [conteo por bucket..., suma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+                    break
+            entry[-2] += value
+            entry[-1] += 1
+
+    def totals(self):
+        """{label_values: (sum, count)} snapshot, used to measure a time window."""
+        with self._lock:
+            return {label_values: (entry[-2], entry[-1]) for label_values, entry in self._values.items()}
+
+    def samples(self):
+        with self._lock:
+            items = [(label_values, list(entry)) for label_values, entry in self._values.items()]
+        names = self.labels + ("le",)
+        for label_values, entry in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                yield f"{self.name}_bucket", _format_labels(names, label_values + (_format_number(bound),)), cumulative
+            yield f"{self.name}_bucket", _format_labels(names, label_values + ("+Inf",)), entry[-1]
+            yield f"{self.name}_sum", _format_labels(self.labels, label_values), entry[-2]
+            yield f"{self.name}_count", _format_labels(self.labels, label_values), entry[-1]
+
+class Gauge:
+    """Value computed on every scrape by a callback returning a number or {label_values: number}."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, callback, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.callback = callback
+
+    def samples(self):
+        try:
+            value = self.callback()
+        except Exception as e:
+            print(f"Error leyendo la métrica {self.name}: {e}")
+            return
+        if isinstance(value, dict):
+            for label_values, v in value.items():
+                yield self.name, _format_labels(self.labels, label_values), v
+        else:
+            yield self.name, "", value
+
+_registry = []
+
+def _register(metric):
+    _registry.append(metric)
+    return metric
+
+def register_gauge(name, help_text, callback, labels=()):
+    return _register(Gauge(name, help_text, callback, labels))
+
+HANDLER_LATENCY = _register(Histogram("loanbot_handler_duration_seconds", "Duración de los handlers de Telegram.", ("handler",)))
+HANDLER_CALLS = _register(Counter("loanbot_handler_calls_total", "Llamadas a handlers de Telegram.", ("handler",)))
+HANDLER_ERRORS = _register(Counter("loanbot_handler_errors_total", "Excepciones no capturadas en handlers.", ("handler", "error")))
+DB_LATENCY = _register(Histogram("loanbot_db_duration_seconds", "Duración de las operaciones de SQLite.", ("operation", "mode")))
+DB_CALLS = _register(Counter("loanbot_db_calls_total", "Operaciones de SQLite.", ("operation", "mode")))
+DB_ERRORS = _register(Counter("loanbot_db_errors_total", "Operaciones de SQLite que fallaron.", ("operation", "mode", "error")))
+DB_ROWS = _register(Counter("loanbot_db_rows_total", "Filas devueltas (lecturas) o modificadas (escrituras).", ("operation", "mode")))
+SHEETS_LATENCY = _register(Histogram("loanbot_sheets_duration_seconds", "Duración de las llamadas a gspread.", ("method",)))
+SHEETS_CALLS = _register(Counter("loanbot_sheets_calls_total", "Llamadas a gspread.", ("method",)))
+SHEETS_ERRORS = _register(Counter("loanbot_sheets_errors_total", "Llamadas a gspread que fallaron.", ("method", "error")))
+LOAN_CACHE_REQUESTS = _register(Counter("loanbot_loan_cache_requests_total", "Búsquedas en la caché de préstamos (hit, miss o stale).", ("result",)))
+
+def render():
+    """All registered metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{labels} {_format_number(value)}")
+    return "\n".join(lines) + "\n"
+
+def record_db(operation, mode, elapsed, rows=None, error=None):
+    """
+    Records one SQLite operation and logs it when it exceeds SLOW_QUERY_MS. The log never
+    includes the query arguments: they carry client names and amounts.
+    """
+    operation = operation.lstrip("_")
+    DB_CALLS.inc(operation, mode)
+    DB_LATENCY.observe(elapsed, operation, mode)
+    if rows:
+        DB_ROWS.inc(operation, mode, amount=rows)
+    if error is not None:
+        DB_ERRORS.inc(operation, mode, type(error).__name__)
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        slow_query_log.warning(json.dumps({
+            "event": "slow_query", "operation": operation, "mode": mode,
+            "ms": round(elapsed * 1000, 1), "rows": rows,
+            "error": type(error).__name__ if error is not None else None,
+        }, ensure_ascii=False))
+
+# Perfilador activo (profiling.HandlerProfiler); None la mayor parte del tiempo
+_profiler = None
+
+def set_profiler(profiler):
+    global _profiler
+    _profiler = profiler
+
+def instrument_handler(callback):
+    """Wraps an async handler callback to record its latency, calls and errors."""
+    name = getattr(callback, "__name__", repr(callback))
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        start = time.perf_counter()
+        try:
+            coroutine = callback(update, context)
+            if _profiler is not None:
+                coroutine = _profiler.wrap(name, coroutine)
+            return await coroutine
+        except Exception as e:
+            HANDLER_ERRORS.inc(name, type(e).__name__)
+            raise
+        finally:
+            HANDLER_CALLS.inc(name)
+            HANDLER_LATENCY.observe(time.perf_counter() - start, name)
+
+    wrapper.instrumented = True
+    return wrapper
+
+def _handler_tree(handlers):
+    for handler in handlers:
+        # ConversationHandler no tiene callback propio: se recorren sus handlers internos
+        if hasattr(handler, "entry_points"):
+            yield from _handler_tree(handler.entry_points)
+            for state_handlers in handler.states.values():
+                yield from _handler_tree(state_handlers)
+            yield from _handler_tree(handler.fallbacks)
+        elif getattr(handler, "callback", None) is not None:
+            yield handler
+
+def iter_handlers(application):
+    """Every handler with a callback registered on the application, including conversation states."""
+    for group in application.handlers.values():
+        yield from _handler_tree(group)
+
+def instrument_application(application):
+    """Instruments every handler registered on the application."""
+    for handler in iter_handlers(application):
+        if not getattr(handler.callback, "instrumented", False):
+            handler.callback = instrument_handler(handler.callback)
+
+class InstrumentedWorksheet:
+    """Proxy for a gspread Worksheet that times every method call; attributes pass through."""
+
+    def __init__(self, worksheet):
+        self._worksheet = worksheet
+
+    def __getattr__(self, attr):
+        value = getattr(self._worksheet, attr)
+        if not callable(value):
+            return value
+
+        @functools.wraps(value)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return value(*args, **kwargs)
+            except Exception as e:
+                SHEETS_ERRORS.inc(attr, type(e).__name__)
+                raise
+            finally:
+                SHEETS_CALLS.inc(attr)
+                SHEETS_LATENCY.observe(time.perf_counter() - start, attr)
+
+        return timed
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Los scrapes de Prometheus no deben llenar el log del bot
+        pass
+
+def start_metrics_server(host=METRICS_LISTEN, port=METRICS_PORT):
+    """Serves GET /metrics on a background thread. Returns the server, or None when disabled."""
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    except OSError as e:
+        print(f"Error al iniciar el servidor de métricas en {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="loanbot-metrics", daemon=True).start()
+    print(f"Métricas disponibles en http://{host}:{port}/metrics")
+    return server
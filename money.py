@@ -0,0 +1,84 @@
+import re
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from functools import total_ordering
+
+# Montos en centavos enteros; las tasas en puntos básicos (10000 = 100%)
+CENTS = 100
+BASIS_POINTS = 10000
+
+def mul_div(value, numerator, denominator):
+    """value * numerator / denominator in integers, rounded half away from zero."""
+    product = value * numerator
+    quotient = (abs(product) * 2 + denominator) // (2 * denominator)
+    return quotient if product >= 0 else -quotient
+
+# "1500", "1500.5", "1500,50": el caso común se convierte sin pasar por Decimal
+_PLAIN_AMOUNT = re.compile(r"\s*(-?)(\d+)(?:[.,](\d{1,2}))?\s*")
+
+def parse_cents(text):
+    """Parses user input such as '1500', '1500.5' or '1500,50' into integer cents. Raises ValueError."""
+    match = _PLAIN_AMOUNT.fullmatch(str(text))
+    if match:
+        sign, units, decimals = match.groups()
+        cents = int(units) * CENTS + int((decimals or "0").ljust(2, "0"))
+        return -cents if sign else cents
+    try:
+        value = Decimal(str(text).strip().replace(",", "."))
+    except InvalidOperation:
+        raise ValueError(f"Monto inválido: {text}") from None
+    if not value.is_finite():
+        raise ValueError(f"Monto inválido: {text}")
+    return int((value * CENTS).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def format_cents(cents):
+    """Formats integer cents as a plain decimal string: 123456 -> '1234.56'."""
+    if cents is None:
+        return ""
+    sign = "-" if cents < 0 else ""
+    units, rest = divmod(abs(int(cents)), CENTS)
+    return f"{sign}{units}.{rest:02d}"
+
+@total_ordering
+class Money:
+    """An exact amount of money stored as integer cents."""
+
+    __slots__ = ("cents",)
+
+    def __init__(self, cents=0):
+        self.cents = int(cents)
+
+    @classmethod
+    def parse(cls, text):
+        """Parses user input such as '1500', '1500.5' or '1500,50'. Raises ValueError."""
+        return cls(parse_cents(text))
+
+    def apply_rate(self, basis_points):
+        """This amount times a rate given in basis points, rounded to the cent."""
+        return Money(mul_div(self.cents, basis_points, BASIS_POINTS))
+
+    def __add__(self, other):
+        return Money(self.cents + other.cents)
+
+    def __sub__(self, other):
+        return Money(self.cents - other.cents)
+
+    def __neg__(self):
+        return Money(-self.cents)
+
+    def __eq__(self, other):
+        return isinstance(other, Money) and self.cents == other.cents
+
+    def __lt__(self, other):
+        return self.cents < other.cents
+
+    def __hash__(self):
+        return hash(self.cents)
+
+    def __bool__(self):
+        return self.cents != 0
+
+    def __str__(self):
+        return format_cents(self.cents)
+
+    def __repr__(self):
+        return f"Money({format_cents(self.cents)})"
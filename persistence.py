@@ -0,0 +1,142 @@
+import json
+import os
+import pickle
+from telegram.ext import BasePersistence, PersistenceInput
+from database import get_db
+
+# Cada cuántos segundos PTB entrega a la persistencia los cambios acumulados
+PERSISTENCE_INTERVAL = float(os.getenv('PERSISTENCE_INTERVAL', '5'))
+
+class LoanDraft:
+    """New-loan conversation state: only what the operator has typed so far."""
+    __slots__ = ("client_name", "amount", "interest", "creation_date", "payment_due_date")
+
+    def __init__(self, client_name=None, amount=None, interest=None, creation_date=None, payment_due_date=None):
+        self.client_name = client_name
+        self.amount = amount
+        self.interest = interest
+        self.creation_date = creation_date
+        self.payment_due_date = payment_due_date
+
+class PaymentDraft:
+    """Payment conversation state: IDs only, the loan is re-read when needed."""
+    __slots__ = ("client_name", "loan_id", "version", "payment_date")
+
+    def __init__(self, client_name=None, loan_id=None, version=None, payment_date=None):
+        self.client_name = client_name
+        self.loan_id = loan_id
+        self.version = version
+        self.payment_date = payment_date
+
+def _load_state(conn, kind):
+    return conn.execute("SELECT key, data FROM bot_state WHERE kind = ?", (kind,)).fetchall()
+
+def _save_state(conn, kind, key, data):
+    if data is None:
+        conn.execute("DELETE FROM bot_state WHERE kind = ? AND key = ?", (kind, key))
+    else:
+        conn.execute("""
+            INSERT INTO bot_state (kind, key, data) VALUES (?, ?, ?)
+            ON CONFLICT (kind, key) DO UPDATE SET data = excluded.data
+        """, (kind, key, data))
+
+def _load_conversations(conn, name):
+    return conn.execute("SELECT key, state FROM conversations WHERE name = ?", (name,)).fetchall()
+
+def _save_conversation(conn, name, key, state):
+    if state is None:
+        conn.execute("DELETE FROM conversations WHERE name = ? AND key = ?", (name, key))
+    else:
+        conn.execute("""
+            INSERT INTO conversations (name, key, state) VALUES (?, ?, ?)
+            ON CONFLICT (name, key) DO UPDATE SET state = excluded.state
+        """, (name, key, state))
+
+def _count_conversations(conn):
+    return conn.execute("SELECT name, COUNT(*) AS active FROM conversations GROUP BY name").fetchall()
+
+def active_conversations():
+    """Conversations in progress per ConversationHandler name, as last persisted."""
+    return {(row["name"],): row["active"] for row in get_db().read_sync(_count_conversations)}
+
+class SQLitePersistence(BasePersistence):
+    """
+    Stores user_data and ConversationHandler states in the bot's SQLite database,
+    one row per user and per conversation, written only when the pickled value
+    changes. Empty user_data and ended conversations are deleted, so idle users
+    cost nothing on disk.
+    """
+
+    def __init__(self, update_interval=PERSISTENCE_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self._saved = {}  # (tipo, clave) -> bytes escritos la última vez
+
+    async def _write(self, kind, key, value):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL) if value else None
+        if self._saved.get((kind, key)) == data:
+            return
+        await get_db().write(_save_state, kind, key, data)
+        if data is None:
+            self._saved.pop((kind, key), None)
+        else:
+            self._saved[(kind, key)] = data
+
+    async def _read(self, kind):
+        rows = await get_db().read(_load_state, kind)
+        self._saved.update(((kind, row["key"]), row["data"]) for row in rows)
+        return {int(row["key"]): pickle.loads(row["data"]) for row in rows}
+
+    async def get_user_data(self):
+        return await self._read("user")
+
+    async def update_user_data(self, user_id, data):
+        await self._write("user", str(user_id), data)
+
+    async def drop_user_data(self, user_id):
+        await self._write("user", str(user_id), None)
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def get_conversations(self, name):
+        rows = await get_db().read(_load_conversations, name)
+        return {tuple(json.loads(row["key"])): pickle.loads(row["state"]) for row in rows}
+
+    async def update_conversation(self, name, key, new_state):
+        state = None if new_state is None else pickle.dumps(new_state, pickle.HIGHEST_PROTOCOL)
+        await get_db().write(_save_conversation, name, json.dumps(list(key)), state)
+
+    # chat_data, bot_data y callback_data no se usan en este bot
+    async def get_chat_data(self):
+        return {}
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def get_bot_data(self):
+        return {}
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def flush(self):
+        # Cada cambio ya se confirmó en SQLite al recibirlo
+        pass
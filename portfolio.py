@@ -0,0 +1,108 @@
+from database import counts_rows, get_db
+from money import BASIS_POINTS
+
+# Mismas reglas que pay_process_amount: 20% mensual simple sobre el capital inicial (en puntos básicos)
+MONTHLY_INTEREST_BP = 2000
+DAYS_PER_MONTH = 30
+INSTALLMENT_BP = 2000
+PAID_STATUS = "Pagado"
+# Denominador del interés diario: monto * días * tasa / (10000 * 30)
+_ACCRUAL_DENOMINATOR = BASIS_POINTS * DAYS_PER_MONTH
+
+# Totales exactos de la cartera en una sola consulta; montos en centavos enteros
+SUMMARY_SQL = f"""
+    WITH dated AS (
+        SELECT status <> '{PAID_STATUS}' AS is_open, amount_cents, capital_cents, paid_cents,
+               COALESCE(MAX(CAST(julianday(:as_of) - julianday(creation_date) AS INTEGER), 0), 0) AS elapsed,
+               CAST(julianday(:as_of) - julianday(payment_due_date) AS INTEGER) AS overdue
+        FROM loans
+    ), accrued AS (
+        SELECT *, CASE WHEN is_open
+                       THEN (amount_cents * elapsed * 2 * {MONTHLY_INTEREST_BP} + {_ACCRUAL_DENOMINATOR}) / (2 * {_ACCRUAL_DENOMINATOR})
+                       ELSE 0 END AS interest
+        FROM dated
+    ), balances AS (
+        SELECT *, CASE WHEN is_open THEN MAX(amount_cents + interest - paid_cents, 0) ELSE 0 END AS balance
+        FROM accrued
+    )
+    SELECT COUNT(*) AS loans,
+           COALESCE(SUM(is_open), 0) AS open_loans,
+           COALESCE(SUM(amount_cents), 0) AS capital_lent,
+           COALESCE(SUM(CASE WHEN is_open THEN capital_cents ELSE 0 END), 0) AS current_capital,
+           COALESCE(SUM(paid_cents), 0) AS paid,
+           COALESCE(SUM(interest), 0) AS accrued_interest,
+           COALESCE(SUM(balance), 0) AS outstanding,
+           COALESCE(SUM(is_open AND overdue > 0), 0) AS overdue_loans,
+           COALESCE(SUM(CASE WHEN is_open AND overdue > 0 THEN balance ELSE 0 END), 0) AS overdue_balance
+    FROM balances
+"""
+
+class Portfolio:
+    """Column-oriented view of a set of loans, one NumPy array per field; amounts in cents."""
+
+    __slots__ = ("ids", "loan_ids", "client_names", "is_open", "amount_cents", "capital_cents",
+                 "paid_cents", "creation_date", "due_date")
+
+    def __init__(self, rows):
+        # NumPy se importa al primer uso: cargarlo cuesta ~70 ms en cada arranque del bot
+        import numpy as np
+        if rows:
+            ids, loan_ids, clients, statuses, amount, capital, paid, created, due = zip(*rows)
+        else:
+            ids = loan_ids = clients = statuses = amount = capital = paid = created = due = ()
+        self.ids = np.array(ids, dtype=np.int64)
+        self.loan_ids = list(loan_ids)
+        self.client_names = list(clients)
+        self.is_open = np.array([status != PAID_STATUS for status in statuses], dtype=bool)
+        self.amount_cents = np.array(amount, dtype=np.int64)
+        self.capital_cents = np.array(capital, dtype=np.int64)
+        self.paid_cents = np.array(paid, dtype=np.int64)
+        self.creation_date = np.array(created, dtype="datetime64[D]")
+        self.due_date = np.array(due, dtype="datetime64[D]")
+
+    def __len__(self):
+        return len(self.ids)
+
+def portfolio_from_loans(loans):
+    """Builds a Portfolio from already fetched loan rows (e.g. one listing page)."""
+    return Portfolio([
+        (
+            loan["id"], loan["loan_id"], loan["client_name"], loan["status"], loan["amount_cents"],
+            loan["capital_cents"], loan["paid_cents"], loan["creation_date"] or "NaT", loan["payment_due_date"] or "NaT",
+        )
+        for loan in loans
+    ])
+
+def compute_balances(portfolio, as_of):
+    """
+    Computes accrued interest, outstanding balance and next installment (in cents)
+    and days overdue for every loan at the `as_of` date in one vectorized pass.
+    """
+    import numpy as np
+    as_of = np.datetime64(as_of, "D")
+    elapsed = np.maximum((as_of - portfolio.creation_date).astype(np.int64), 0)
+    elapsed = np.where(np.isnat(portfolio.creation_date), 0, elapsed)
+    # Redondeo al centavo en enteros, igual que money.mul_div; SUMMARY_SQL repite la fórmula
+    # en SQL y tests/test_portfolio.py comprueba que ambos coinciden
+    accrued = (portfolio.amount_cents * elapsed * 2 * MONTHLY_INTEREST_BP + _ACCRUAL_DENOMINATOR) // (2 * _ACCRUAL_DENOMINATOR)
+    accrued = np.where(portfolio.is_open, accrued, 0)
+    balance = np.maximum(portfolio.amount_cents + accrued - portfolio.paid_cents, 0)
+    balance = np.where(portfolio.is_open, balance, 0)
+    capital = np.where(portfolio.is_open, np.maximum(portfolio.capital_cents, 0), 0)
+    next_installment = (capital * 2 * INSTALLMENT_BP + BASIS_POINTS) // (2 * BASIS_POINTS)
+    overdue = (as_of - portfolio.due_date).astype(np.int64)
+    overdue = np.where(np.isnat(portfolio.due_date) | ~portfolio.is_open, 0, np.maximum(overdue, 0))
+    return {
+        "accrued_interest": accrued,
+        "balance": balance,
+        "next_installment": next_installment,
+        "days_overdue": overdue,
+    }
+
+@counts_rows(lambda summary: summary["loans"])
+def _portfolio_summary(conn, as_of):
+    return dict(conn.execute(SUMMARY_SQL, {"as_of": as_of.isoformat()}).fetchone())
+
+async def get_portfolio_summary(as_of):
+    """Portfolio totals in cents, aggregated by SQLite on a reader thread."""
+    return await get_db().read(_portfolio_summary, as_of)
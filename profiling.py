@@ -0,0 +1,170 @@
+import asyncio
+import cProfile
+import os
+import pstats
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+import metrics
+
+load_dotenv()
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+# Segundos de perfilado al arrancar el bot (0 = desactivado)
+PROFILE_ON_START = float(os.getenv('PROFILE_ON_START', '0'))
+PROFILE_MAX_SECONDS = 600
+TOP_FUNCTIONS = 25
+# Tramos de pila por debajo de esto (en segundos) no se escriben en collapsed.txt
+COLLAPSED_MIN_SECONDS = 1e-5
+
+class _ProfiledCoroutine:
+    """
+    Drives a handler coroutine one step at a time with its handler's cProfile enabled
+    only while that step runs. Steps never overlap on the event loop, so concurrent
+    handlers each get their own stats and time spent awaiting is left out.
+    """
+
+    __slots__ = ("coroutine", "profiler", "profile")
+
+    def __init__(self, coroutine, profiler, profile):
+        self.coroutine = coroutine
+        self.profiler = profiler
+        self.profile = profile
+
+    def __await__(self):
+        coroutine = self.coroutine
+        value, error = None, None
+        while True:
+            recording = self.profiler.recording
+            if recording:
+                self.profile.enable()
+            try:
+                if error is None:
+                    awaited = coroutine.send(value)
+                else:
+                    awaited = coroutine.throw(error)
+            except StopIteration as e:
+                return e.value
+            finally:
+                if recording:
+                    self.profile.disable()
+            try:
+                value, error = (yield awaited), None
+            except GeneratorExit:
+                coroutine.close()
+                raise
+            except BaseException as e:
+                value, error = None, e
+
+class HandlerProfiler:
+    """
+    On-demand cProfile of the registered handlers for a fixed window. While it is off
+    the metrics wrapper only checks a module global, so the handlers pay nothing.
+    """
+
+    def __init__(self, output_dir=PROFILE_DIR):
+        self.output_dir = output_dir
+        self.recording = False
+        self._profiles = {}
+        self._timer = None
+        self._done = None
+        self._started = None
+        self._latency_before = None
+
+    @property
+    def active(self):
+        return self.recording
+
+    def wrap(self, name, coroutine):
+        if not self.recording:
+            return coroutine
+        profile = self._profiles.get(name)
+        if profile is None:
+            profile = self._profiles[name] = cProfile.Profile()
+        return _ProfiledCoroutine(coroutine, self, profile)
+
+    def start(self, seconds):
+        """
+        Starts profiling for `seconds` (called on the event loop). Returns an asyncio
+        Future resolved with the output directory once it switches itself off.
+        """
+        if self.recording:
+            raise RuntimeError("Ya hay un perfilado en curso")
+        seconds = min(max(seconds, 1), PROFILE_MAX_SECONDS)
+        loop = asyncio.get_running_loop()
+        self._profiles = {}
+        self._started = time.monotonic()
+        self._latency_before = metrics.HANDLER_LATENCY.totals()
+        self._done = loop.create_future()
+        self._timer = loop.call_later(seconds, self.stop)
+        self.recording = True
+        metrics.set_profiler(self)
+        return self._done
+
+    def stop(self):
+        """Switches profiling off and writes the results in a worker thread."""
+        if not self.recording:
+            return
+        self.recording = False
+        metrics.set_profiler(None)
+        self._timer.cancel()
+        elapsed = time.monotonic() - self._started
+        asyncio.get_running_loop().create_task(
+            self._finish(self._done, self._profiles, self._latency_before, elapsed)
+        )
+
+    async def _finish(self, done, profiles, latency_before, elapsed):
+        try:
+            path = await asyncio.to_thread(self._write, profiles, latency_before, elapsed)
+        except Exception as e:
+            print(f"Error escribiendo el perfilado: {e}")
+            done.set_exception(e)
+        else:
+            done.set_result(path)
+
+    def _write(self, profiles, latency_before, elapsed):
+        path = os.path.join(self.output_dir, datetime.now().strftime("%Y%m%d-%H%M%S"))
+        os.makedirs(path, exist_ok=True)
+        latency_after = metrics.HANDLER_LATENCY.totals()
+        with open(os.path.join(path, "handlers.txt"), "w", encoding="utf-8") as report, \
+                open(os.path.join(path, "collapsed.txt"), "w", encoding="utf-8") as collapsed:
+            report.write(f"Ventana de perfilado: {elapsed:.1f}s\n")
+            for name, profile in sorted(profiles.items()):
+                total, calls = latency_after.get((name,), (0.0, 0))
+                before_total, before_calls = latency_before.get((name,), (0.0, 0))
+                calls, total = calls - before_calls, total - before_total
+                profile.dump_stats(os.path.join(path, f"{name}.prof"))
+                stats = pstats.Stats(profile, stream=report)
+                report.write(f"\n== {name}: {calls} llamadas, {total * 1000:.1f} ms de reloj, "
+                             f"{stats.total_tt * 1000:.1f} ms de CPU en el bucle de eventos\n")
+                stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+                for stack, seconds in collapsed_stacks(stats.stats):
+                    collapsed.write(f"{name};{stack} {round(seconds * 1e6)}\n")
+        return path
+
+def _label(func):
+    filename, line, name = func
+    return f"{name} ({os.path.basename(filename)}:{line})" if line else name
+
+def collapsed_stacks(stats):
+    """
+    Approximates "collapsed" stacks (flamegraph.pl, speedscope, inferno) from a pstats
+    call graph: each function's time is split among its callers by their share of
+    its cumulative time. Yields (stack, seconds) with stacks joined by ';'.
+    """
+    children = {}
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            children.setdefault(caller, []).append((func, edge[3]))
+    roots = [func for func, entry in stats.items() if not entry[4]]
+    pending = [(root, (_label(root),), stats[root][3]) for root in roots]
+    while pending:
+        func, path, seconds = pending.pop()
+        total_tt, total_ct = stats[func][2], stats[func][3]
+        share = seconds / total_ct if total_ct else 0
+        if total_tt * share >= COLLAPSED_MIN_SECONDS:
+            yield ";".join(path), total_tt * share
+        for child, edge_ct in children.get(func, ()):
+            child_seconds = edge_ct * share
+            label = _label(child)
+            if child_seconds >= COLLAPSED_MIN_SECONDS and label not in path:
+                pending.append((child, path + (label,), child_seconds))
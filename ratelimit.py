@@ -0,0 +1,45 @@
+import asyncio
+import time
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, up to `capacity` saved for bursts."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        # El lock hace que los que esperan salgan en orden de llegada
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+class SendLimiter:
+    """
+    Paces Telegram sends: at most `per_second` messages overall (token bucket) and
+    one message per chat every `per_chat_interval` seconds.
+    """
+
+    def __init__(self, per_second=25, per_chat_interval=1.0):
+        self.bucket = TokenBucket(per_second, per_second)
+        self.per_chat_interval = per_chat_interval
+        self._next_slot = {}  # chat_id -> instante (monotonic) del próximo envío permitido
+
+    async def acquire(self, chat_id):
+        now = time.monotonic()
+        slot = max(now, self._next_slot.get(chat_id, now))
+        self._next_slot[chat_id] = slot + self.per_chat_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+        await self.bucket.acquire()
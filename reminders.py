@@ -0,0 +1,100 @@
+import asyncio
+import os
+from datetime import date, datetime, timedelta
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+from amortization import format_date
+from database import OPEN_STATUSES, _OPEN_PLACEHOLDERS, get_db
+from money import format_cents
+from ratelimit import SendLimiter
+
+REMINDER_TIME = os.getenv('REMINDER_TIME', '08:00')
+REMINDER_DAYS_AHEAD = int(os.getenv('REMINDER_DAYS_AHEAD', '3'))
+# Préstamos listados por operador; el resto solo se cuenta, así el resumen cabe en un mensaje
+REMINDER_MAX_LOANS = 30
+# Telegram admite unos 30 mensajes por segundo en total y 1 por segundo por chat
+TELEGRAM_MESSAGES_PER_SECOND = 25
+SEND_ATTEMPTS = 3
+
+# Una sola consulta sobre idx_loans_status_due; las ventanas agregan por operador en SQLite
+REMINDER_SQL = f"""
+    SELECT * FROM (
+        SELECT user_id, loan_id, client_name, payment_due_date, capital_cents,
+               ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY payment_due_date, id) AS position,
+               COUNT(*) OVER (PARTITION BY user_id) AS total,
+               SUM(payment_due_date < ?) OVER (PARTITION BY user_id) AS overdue,
+               SUM(capital_cents) OVER (PARTITION BY user_id) AS capital
+        FROM loans
+        WHERE status IN ({_OPEN_PLACEHOLDERS}) AND payment_due_date <= ?
+    )
+    WHERE position <= ?
+    ORDER BY user_id, position
+"""
+
+def get_reminder_rows(conn, today, until, max_loans=REMINDER_MAX_LOANS):
+    """Open loans due up to `until`, at most `max_loans` per operator, with per-operator totals."""
+    return conn.execute(
+        REMINDER_SQL, (today.isoformat(), *OPEN_STATUSES, until.isoformat(), max_loans)
+    ).fetchall()
+
+def build_digests(rows, today):
+    """Groups the reminder rows by operator. Returns a list of (chat_id, message)."""
+    digests, lines, current = [], [], None
+    for row in rows:
+        if row["user_id"] != current:
+            if current is not None:
+                digests.append((current, _digest_text(lines, header, today)))
+            current, lines, header = row["user_id"], [], row
+        icon = "🔴" if row["payment_due_date"] < today.isoformat() else "🟡"
+        lines.append(
+            f"{icon} {format_date(row['payment_due_date'])} | {row['loan_id']} | "
+            f"{row['client_name']} | {format_cents(row['capital_cents'])}"
+        )
+    if current is not None:
+        digests.append((current, _digest_text(lines, header, today)))
+    return digests
+
+def _digest_text(lines, totals, today):
+    upcoming = totals["total"] - totals["overdue"]
+    text = [
+        f"⏰ Recordatorio de cobros ({format_date(today)})",
+        f"Vencidos: {totals['overdue']} · Vencen en {REMINDER_DAYS_AHEAD} días: {upcoming} · "
+        f"Capital pendiente: {format_cents(totals['capital'])}",
+        "",
+        *lines,
+    ]
+    if totals["total"] > len(lines):
+        text.append(f"… y {totals['total'] - len(lines)} más. Usa /listarprestamos vencidos para verlos.")
+    return "\n".join(text)
+
+def _seconds(value):
+    return value.total_seconds() if isinstance(value, timedelta) else float(value)
+
+async def _send(bot, limiter, chat_id, text):
+    for _ in range(SEND_ATTEMPTS):
+        await limiter.acquire(chat_id)
+        try:
+            await bot.send_message(chat_id=chat_id, text=text)
+            return True
+        except RetryAfter as e:
+            await asyncio.sleep(_seconds(e.retry_after))
+        except (Forbidden, BadRequest) as e:
+            # El operador bloqueó el bot o nunca abrió el chat: no tiene sentido reintentar
+            print(f"Error enviando recordatorio a {chat_id}: {e}")
+            return False
+        except TelegramError as e:
+            print(f"Error de red enviando recordatorio a {chat_id}: {e}")
+    return False
+
+async def send_due_reminders(context):
+    """JobQueue callback: one digest per operator with their overdue and upcoming loans."""
+    today = date.today()
+    rows = await get_db().read(get_reminder_rows, today, today + timedelta(days=REMINDER_DAYS_AHEAD))
+    digests = build_digests(rows, today)
+    limiter = SendLimiter(TELEGRAM_MESSAGES_PER_SECOND)
+    results = await asyncio.gather(*(_send(context.bot, limiter, chat_id, text) for chat_id, text in digests))
+    print(f"Recordatorios enviados: {sum(results)} de {len(digests)}")
+
+def schedule_reminders(job_queue):
+    """Registers the daily reminder job at REMINDER_TIME (HH:MM, local time)."""
+    at = datetime.strptime(REMINDER_TIME, "%H:%M").time().replace(tzinfo=datetime.now().astimezone().tzinfo)
+    return job_queue.run_daily(send_due_reminders, time=at, name="recordatorios")
@@ -0,0 +1,112 @@
+import argparse
+import hashlib
+import os
+import gspread
+from database import get_db, init_db, close_db
+from amortization import format_date
+from money import CENTS
+from google_sheets_integration import HEADER, SheetRowIndex, init_gspread_client, sheet_status
+
+# Una sola consulta: cada préstamo con la fecha de su último pago del libro
+LOANS_FOR_SHEET_SQL = """
+    SELECT l.loan_id, l.creation_date, l.client_name, l.amount_cents, l.interest_cents,
+           (SELECT MAX(p.payment_date) FROM payments p WHERE p.loan_id = l.loan_id) AS last_payment,
+           l.paid_cents, l.status
+    FROM loans l ORDER BY l.id
+"""
+
+def loan_to_sheet_row(loan):
+    """Builds the sheet row (HEADER order) for a loan; Saldo and Estatus follow the sheet's rules."""
+    loan_id, creation_date, client_name, amount, interest, last_payment, paid, status = loan
+    balance = max(amount + (interest or 0) - paid, 0)
+    # La hoja guarda unidades, no centavos; Estatus usa el mismo vocabulario que SheetSyncQueue
+    return [
+        loan_id, format_date(creation_date), client_name, amount / CENTS, interest / CENTS if interest is not None else "",
+        format_date(last_payment), paid / CENTS, balance / CENTS, sheet_status(status),
+    ]
+
+def _normalize(value):
+    # La hoja devuelve texto ("100", "100.5"); SQLite devuelve números. Se comparan ya formateados.
+    if value is None:
+        return ""
+    try:
+        return f"{float(value):.2f}"
+    except (TypeError, ValueError):
+        return str(value).strip()
+
+def row_hash(row):
+    normalized = "\x1f".join(_normalize(value) for value in row)
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).digest()
+
+def _read_loans(conn):
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    return [loan_to_sheet_row(loan) for loan in cursor.execute(LOANS_FOR_SHEET_SQL)]
+
+def diff(db_rows, index):
+    """
+    Compares SQLite rows with the cached sheet rows.
+    Returns (changed_cells, missing_rows, extra_ids): changed_cells is a list of
+    (row_number, column_index, value), missing_rows the rows to append and
+    extra_ids the loan IDs present only in the sheet.
+    """
+    changed_cells, missing_rows = [], []
+    seen = set()
+    for row in db_rows:
+        loan_id = str(row[0])
+        seen.add(loan_id)
+        sheet_row = index.values.get(loan_id)
+        if sheet_row is None:
+            missing_rows.append(row)
+            continue
+        if row_hash(row) == row_hash(sheet_row[:len(HEADER)]):
+            continue
+        for col, (db_value, sheet_value) in enumerate(zip(row, sheet_row)):
+            if _normalize(db_value) != _normalize(sheet_value):
+                changed_cells.append((index.rows[loan_id], col, db_value))
+    extra_ids = [loan_id for loan_id in index.rows if loan_id not in seen]
+    return changed_cells, missing_rows, extra_ids
+
+def reconcile(worksheet, dry_run=False):
+    """Reads the sheet and SQLite once each and pushes only the differences. Returns the diff."""
+    index = SheetRowIndex().load(worksheet)
+    db_rows = get_db().read_sync(_read_loans)
+    changed_cells, missing_rows, extra_ids = diff(db_rows, index)
+    if not dry_run:
+        if changed_cells:
+            worksheet.batch_update([
+                {'range': gspread.utils.rowcol_to_a1(row_number, col + 1), 'values': [[value]]}
+                for row_number, col, value in changed_cells
+            ])
+        if missing_rows:
+            worksheet.append_rows(missing_rows)
+    return changed_cells, missing_rows, extra_ids
+
+def print_report(changed_cells, missing_rows, extra_ids, dry_run, limit=20):
+    prefix = "[dry-run] " if dry_run else ""
+    print(f"{prefix}Celdas distintas: {len(changed_cells)} en {len({c[0] for c in changed_cells})} filas")
+    for row_number, col, value in changed_cells[:limit]:
+        print(f"  fila {row_number}, {HEADER[col]} -> {value}")
+    print(f"{prefix}Préstamos que faltan en la hoja: {len(missing_rows)}")
+    for row in missing_rows[:limit]:
+        print(f"  {row[0]} ({row[2]})")
+    print(f"{prefix}Filas de la hoja sin préstamo en SQLite: {len(extra_ids)}")
+    for loan_id in extra_ids[:limit]:
+        print(f"  {loan_id}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Sincroniza la tabla loans con la hoja de Google Sheets.")
+    parser.add_argument("--credentials", default=os.getenv('GOOGLE_OAUTH_CLIENT_SECRET_FILE'))
+    parser.add_argument("--sheet", default=os.getenv('GOOGLE_SHEET_NAME'))
+    parser.add_argument("--worksheet", default=os.getenv('GOOGLE_SHEET_WORKSHEET_NAME', 'Sheet1'))
+    parser.add_argument("--dry-run", action="store_true", help="solo mostrar las diferencias")
+    args = parser.parse_args()
+
+    worksheet = init_gspread_client(args.credentials, args.sheet, args.worksheet)
+    if not worksheet:
+        raise SystemExit(1)
+    init_db()
+    try:
+        print_report(*reconcile(worksheet, dry_run=args.dry_run), dry_run=args.dry_run)
+    finally:
+        close_db()
@@ -0,0 +1,204 @@
+import argparse
+import asyncio
+import gzip
+import os
+import re
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+from database import DATABASE_NAME, connect, get_db
+
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', 'snapshots')
+# Segundos entre instantáneas automáticas de la base (0 = desactivadas)
+SNAPSHOT_INTERVAL = int(os.getenv('SNAPSHOT_INTERVAL', '3600'))
+# Retención: la más reciente de cada una de las últimas N horas, días y semanas con instantánea
+SNAPSHOT_KEEP_HOURLY = int(os.getenv('SNAPSHOT_KEEP_HOURLY', '24'))
+SNAPSHOT_KEEP_DAILY = int(os.getenv('SNAPSHOT_KEEP_DAILY', '7'))
+SNAPSHOT_KEEP_WEEKLY = int(os.getenv('SNAPSHOT_KEEP_WEEKLY', '4'))
+# Páginas copiadas por paso de la API de backup y pausa entre pasos (en segundos)
+SNAPSHOT_PAGES_PER_STEP = 256
+SNAPSHOT_STEP_SLEEP = 0.005
+SNAPSHOT_TIME_FORMAT = "%Y%m%d-%H%M%S"
+_SNAPSHOT_NAME = re.compile(r"^snapshot-(\d{8}-\d{6})\.db\.gz$")
+_COPY_CHUNK = 1024 * 1024
+
+class SnapshotError(Exception):
+    """A snapshot failed PRAGMA integrity_check or could not be read."""
+
+def snapshot_name(taken):
+    return f"snapshot-{taken.strftime(SNAPSHOT_TIME_FORMAT)}.db.gz"
+
+def list_snapshots(output_dir=SNAPSHOT_DIR):
+    """[(path, taken)] of the snapshots in output_dir, newest first."""
+    if not os.path.isdir(output_dir):
+        return []
+    snapshots = []
+    for name in os.listdir(output_dir):
+        match = _SNAPSHOT_NAME.match(name)
+        if match:
+            snapshots.append((os.path.join(output_dir, name), datetime.strptime(match.group(1), SNAPSHOT_TIME_FORMAT)))
+    return sorted(snapshots, key=lambda snapshot: snapshot[1], reverse=True)
+
+def _copy_database(source_path, target_path, pages=SNAPSHOT_PAGES_PER_STEP, sleep=SNAPSHOT_STEP_SLEEP):
+    source = connect(source_path, readonly=True)
+    target = sqlite3.connect(target_path)
+    try:
+        # Con una transacción de lectura abierta todos los pasos ven la misma versión de la base.
+        # Sin ella, cada escritura del bot entre dos pasos reinicia la copia desde la primera página.
+        # En WAL esa lectura no bloquea a los escritores; solo retrasa el checkpoint hasta terminar.
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        source.backup(target, pages=pages, sleep=sleep)
+        source.execute("COMMIT")
+        # La copia es un solo archivo, sin -wal ni -shm
+        target.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        target.close()
+        source.close()
+
+def verify(path):
+    """Runs PRAGMA integrity_check on an uncompressed database file. Raises SnapshotError if it is not ok."""
+    conn = sqlite3.connect(path)
+    try:
+        result = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+    except sqlite3.DatabaseError as e:
+        raise SnapshotError(f"{path}: {e}") from e
+    finally:
+        conn.close()
+    if result != ["ok"]:
+        raise SnapshotError(f"{path}: " + "; ".join(result[:5]))
+
+def _compress(path, target):
+    partial = f"{target}.part"
+    with open(path, "rb") as source, gzip.open(partial, "wb", compresslevel=6) as compressed:
+        shutil.copyfileobj(source, compressed, _COPY_CHUNK)
+    os.replace(partial, target)
+
+def _decompress(path, target):
+    with gzip.open(path, "rb") as compressed, open(target, "wb") as output:
+        shutil.copyfileobj(compressed, output, _COPY_CHUNK)
+
+def retained(snapshots, hourly=SNAPSHOT_KEEP_HOURLY, daily=SNAPSHOT_KEEP_DAILY, weekly=SNAPSHOT_KEEP_WEEKLY):
+    """
+    Paths to keep from [(path, taken)]: the newest snapshot of each of the last `hourly`
+    hours, `daily` days and `weekly` ISO weeks that have one. The newest is always kept.
+    """
+    ordered = sorted(snapshots, key=lambda snapshot: snapshot[1], reverse=True)
+    keep = {ordered[0][0]} if ordered else set()
+    periods = (
+        (hourly, lambda taken: (taken.date(), taken.hour)),
+        (daily, lambda taken: taken.date()),
+        (weekly, lambda taken: taken.isocalendar()[:2]),
+    )
+    for count, period in periods:
+        seen = set()
+        for path, taken in ordered:
+            key = period(taken)
+            if key in seen:
+                continue
+            if len(seen) >= count:
+                break
+            seen.add(key)
+            keep.add(path)
+    return keep
+
+def prune(output_dir=SNAPSHOT_DIR):
+    """Deletes the snapshots outside the retention policy. Returns the deleted paths."""
+    snapshots = list_snapshots(output_dir)
+    keep = retained(snapshots)
+    deleted = []
+    for path, _ in snapshots:
+        if path not in keep:
+            os.remove(path)
+            deleted.append(path)
+    return deleted
+
+def take_snapshot(source_path=DATABASE_NAME, output_dir=SNAPSHOT_DIR):
+    """
+    Copies the live database with the online backup API, checks the copy with
+    PRAGMA integrity_check, stores it gzipped in output_dir and applies the retention
+    policy. Blocks, so call it from a worker thread. Returns the snapshot path.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    taken = datetime.now()
+    target = os.path.join(output_dir, snapshot_name(taken))
+    raw = f"{target}.tmp"
+    try:
+        _copy_database(source_path, raw)
+        verify(raw)
+        _compress(raw, target)
+    finally:
+        if os.path.exists(raw):
+            os.remove(raw)
+    prune(output_dir)
+    return target
+
+def restore_snapshot(snapshot_path, database_path=DATABASE_NAME):
+    """
+    Replaces database_path with a verified snapshot. The bot must be stopped. The current
+    file and its -wal/-shm are kept with the .pre-restore suffix. Returns that backup path.
+    """
+    restored = f"{database_path}.restore"
+    try:
+        _decompress(snapshot_path, restored)
+        verify(restored)
+    except (OSError, EOFError) as e:
+        if os.path.exists(restored):
+            os.remove(restored)
+        raise SnapshotError(f"{snapshot_path}: {e}") from e
+    except SnapshotError:
+        os.remove(restored)
+        raise
+    previous = f"{database_path}.pre-restore"
+    # El -wal de la base anterior no debe aplicarse sobre la restaurada
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(database_path + suffix):
+            os.replace(database_path + suffix, previous + suffix)
+    os.replace(restored, database_path)
+    return previous
+
+async def snapshot_job(context):
+    """JobQueue callback: takes a snapshot of the bot's database off the event loop."""
+    start = time.perf_counter()
+    try:
+        path = await asyncio.to_thread(take_snapshot, get_db().path)
+    except Exception as e:
+        print(f"Error tomando la instantánea de la base: {e}")
+        return
+    print(f"Instantánea de la base guardada en {path} ({time.perf_counter() - start:.1f}s)")
+
+def schedule_snapshots(job_queue):
+    """Registers the snapshot job every SNAPSHOT_INTERVAL seconds. Returns None when disabled."""
+    if SNAPSHOT_INTERVAL <= 0:
+        return None
+    return job_queue.run_repeating(snapshot_job, interval=SNAPSHOT_INTERVAL, first=SNAPSHOT_INTERVAL, name="instantaneas")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Instantáneas comprimidas de la base SQLite.")
+    parser.add_argument("--database", default=DATABASE_NAME)
+    parser.add_argument("--dir", default=SNAPSHOT_DIR, help="directorio de las instantáneas")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("take", help="tomar una instantánea ahora (el bot puede seguir en marcha)")
+    commands.add_parser("list", help="listar las instantáneas")
+    restore = commands.add_parser("restore", help="reemplazar la base por una instantánea (con el bot detenido)")
+    restore.add_argument("snapshot", help="archivo .db.gz, o 'latest' para la más reciente")
+    args = parser.parse_args()
+
+    if args.command == "take":
+        print(take_snapshot(args.database, args.dir))
+    elif args.command == "list":
+        for path, taken in list_snapshots(args.dir):
+            print(f"{taken:%Y-%m-%d %H:%M:%S}  {os.path.getsize(path) / 1024 / 1024:8.1f} MB  {path}")
+    else:
+        snapshot = args.snapshot
+        if snapshot == "latest":
+            snapshots = list_snapshots(args.dir)
+            if not snapshots:
+                raise SystemExit(f"No hay instantáneas en {args.dir}")
+            snapshot = snapshots[0][0]
+        try:
+            previous = restore_snapshot(snapshot, args.database)
+        except SnapshotError as e:
+            raise SystemExit(f"La instantánea no es válida: {e}")
+        print(f"Base restaurada desde {snapshot}; la anterior quedó en {previous}")
@@ -0,0 +1,15 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import open_db, init_db, close_db
+
+@pytest.fixture
+def db(tmp_path):
+    """Shared data layer pointed at a fresh, migrated database file."""
+    database = open_db(str(tmp_path / "loans.db"))
+    init_db()
+    yield database
+    close_db()
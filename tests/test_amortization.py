@@ -0,0 +1,25 @@
+from datetime import date
+from amortization import split_payment
+
+def _loan(amount=100000, paid=0, capital=None):
+    capital = amount if capital is None else capital
+    return {"amount_cents": amount, "paid_cents": paid, "capital_cents": capital, "creation_date": "2026-01-01"}
+
+def test_partial_payment_covers_interest_first():
+    # 31 días al 20% mensual sobre 1000.00: 206.67 de interés
+    split = split_payment(_loan(), 50000, date(2026, 2, 1))
+    assert (split.to_interest, split.to_capital, split.overpayment) == (20667, 29333, 0)
+    assert (split.new_capital, split.status) == (70667, "Parcialmente Pagado")
+
+def test_overpayment_never_amortizes_more_than_the_outstanding_capital():
+    split = split_payment(_loan(), 200000, date(2026, 2, 1))
+    assert split.to_capital == 100000
+    assert split.overpayment == 200000 - 20667 - 100000
+    assert split.to_interest + split.to_capital + split.overpayment == 200000
+    assert (split.new_capital, split.balance, split.status) == (0, 0, "Pagado")
+
+def test_overpayment_after_partial_payments():
+    split = split_payment(_loan(paid=80000, capital=30000), 60000, date(2026, 1, 16))
+    # 15 días: 100.00 de interés, ya cubierto por lo pagado antes
+    assert (split.to_interest, split.to_capital, split.overpayment) == (0, 30000, 30000)
+    assert split.new_paid == 140000
@@ -0,0 +1,62 @@
+import gzip
+import io
+from datetime import date
+from csv_import import import_loans_csv
+from ledger import replay_loans
+
+TODAY = date(2026, 3, 1)
+
+CSV = """Client Name,Amount,Interest,Paid Amount,Current Capital,Status
+Ana,1000,200,0,900,
+Beto,1000,200,300,800,
+Carla,500,100,,,Pagado
+Dan,500,100,600,0,Pagado
+Eva,500,100,0,500,Parcialmente Pagado
+Fede,500,100,0,500,
+,500,100,0,500,
+Gus,500,100,0,600,
+Hugo,500,100,0,500,Cancelado
+Ines,-5,1,0,,
+"""
+
+def _balances(conn):
+    rows = conn.execute("SELECT client_name, status, paid_cents, capital_cents FROM loans ORDER BY id").fetchall()
+    return [tuple(row) for row in rows]
+
+def _import(text, compressed=False):
+    data = text.encode("utf-8")
+    if compressed:
+        data = gzip.compress(data)
+    return import_loans_csv(io.BytesIO(data), "op", "Operador", compressed=compressed, today=TODAY)
+
+def test_invalid_rows_are_reported_and_skipped(db):
+    result = _import(CSV)
+    assert (result.rows, result.loans, result.error_count) == (10, 6, 4)
+    assert [line for line, _ in result.errors] == [8, 9, 10, 11]
+    messages = dict(result.errors)
+    assert messages[8] == "falta el cliente"
+    assert messages[9] == "el capital actual supera al monto"
+    assert messages[10] == "estado desconocido: Cancelado"
+    assert messages[11].startswith("el monto negativo")
+    assert result.error_file.read().decode("utf-8").splitlines()[0] == "Fila,Error"
+
+def test_paid_status_with_pending_capital_is_rejected(db):
+    result = _import("Client Name,Amount,Paid Amount,Current Capital,Status\nDan,500,600,100,Pagado\n")
+    assert (result.loans, result.errors) == (0, [(2, "estado Pagado con capital pendiente")])
+
+def test_replaying_the_ledger_keeps_imported_balances(db):
+    result = _import(CSV, compressed=True)
+    # Fede es el único Pendiente con todo el capital y sin pagos: no necesita asiento
+    assert (result.loans, result.payments) == (6, 5)
+    imported = db.read_sync(_balances)
+    assert imported == [
+        ("Ana", "Pendiente", 0, 90000),
+        ("Beto", "Parcialmente Pagado", 30000, 80000),
+        ("Carla", "Pagado", 0, 0),
+        ("Dan", "Pagado", 60000, 0),
+        ("Eva", "Parcialmente Pagado", 0, 50000),
+        ("Fede", "Pendiente", 0, 50000),
+    ]
+    # Ana no tiene pagos pero sí capital amortizado: sin asiento el recálculo le devolvería 1000
+    assert db.write_sync(replay_loans) == 6
+    assert db.read_sync(_balances) == imported
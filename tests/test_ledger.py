@@ -0,0 +1,83 @@
+import asyncio
+import pytest
+from datetime import date
+from database import LoanClosedError, _create_loan, get_cached_loans_page, get_loan_by_id
+from loan_cache import loan_cache
+from ledger import apply_payment, db_apply_payment, get_payments, replay_loans
+
+def _create(conn, client_name):
+    return _create_loan(conn, "7", "Operador", client_name, 100000, 20000, "2026-02-01", "Pendiente", 0, "2026-01-01")
+
+def _balances(conn, loan_id):
+    loan = get_loan_by_id(conn, loan_id)
+    return loan["status"], loan["paid_cents"], loan["capital_cents"]
+
+def _replay(db, loan_id):
+    before = db.read_sync(_balances, loan_id)
+    assert db.write_sync(replay_loans, [loan_id]) == 1
+    return before, db.read_sync(_balances, loan_id)
+
+def test_backdated_payoff_keeps_the_loan_paid(db):
+    loan_id = db.write_sync(_create, "Ana")
+    db.write_sync(apply_payment, loan_id, 30000, date(2026, 3, 1))
+    # Registrado después pero con fecha anterior: liquida el préstamo
+    _, split, _ = db.write_sync(apply_payment, loan_id, 200000, date(2026, 2, 15))
+    assert split.status == "Pagado"
+
+    before, after = _replay(db, loan_id)
+    assert before[0] == "Pagado"
+    assert after == before
+    # El excedente del pago no se registra como capital
+    assert sum(payment["capital_cents"] for payment in db.read_sync(get_payments, loan_id)) == 100000
+
+def test_backdated_partial_payment_after_a_later_one(db):
+    loan_id = db.write_sync(_create, "Beto")
+    db.write_sync(apply_payment, loan_id, 10000, date(2026, 3, 1))
+    db.write_sync(apply_payment, loan_id, 5000, date(2026, 1, 20))
+
+    before, after = _replay(db, loan_id)
+    assert before[:2] == ("Parcialmente Pagado", 15000)
+    assert after == before
+    assert [payment["payment_date"] for payment in db.read_sync(get_payments, loan_id)] == ["2026-03-01", "2026-01-20"]
+
+def test_replay_only_touches_the_given_loans(db):
+    paid = db.write_sync(_create, "Carla")
+    untouched = db.write_sync(_create, "Dan")
+    db.write_sync(apply_payment, paid, 200000, date(2026, 2, 1))
+    db.write_sync(lambda conn: conn.execute("UPDATE loans SET paid_cents = 1 WHERE loan_id = ?", (untouched,)))
+
+    _replay(db, paid)
+    assert db.read_sync(_balances, untouched) == ("Pendiente", 1, 100000)
+    assert db.read_sync(_balances, paid) == ("Pagado", 200000, 0)
+
+def test_stale_version_recomputes_the_split(db):
+    loan_id = db.write_sync(_create, "Eva")
+    version = db.read_sync(get_loan_by_id, loan_id)["version"]
+    _, first, stale = db.write_sync(apply_payment, loan_id, 50000, date(2026, 2, 1), version)
+    assert not stale
+    # Misma versión que mostró la conversación: el segundo pago ve el capital ya reducido
+    _, second, stale = db.write_sync(apply_payment, loan_id, 30000, date(2026, 2, 1), version)
+    assert stale
+    assert second.new_paid == 80000
+    assert second.new_capital == first.new_capital - second.to_capital
+
+def test_payment_on_a_paid_loan_is_refused(db):
+    loan_id = db.write_sync(_create, "Fede")
+    version = db.read_sync(get_loan_by_id, loan_id)["version"]
+    _, split, _ = db.write_sync(apply_payment, loan_id, 200000, date(2026, 2, 1), version)
+    assert split.status == "Pagado"
+    paid = db.read_sync(_balances, loan_id)
+
+    with pytest.raises(LoanClosedError):
+        db.write_sync(apply_payment, loan_id, 200000, date(2026, 2, 1), version)
+    with pytest.raises(LoanClosedError):
+        asyncio.run(db_apply_payment(loan_id, 200000, date(2026, 2, 1), version))
+    assert db.read_sync(_balances, loan_id) == paid
+    assert len(db.read_sync(get_payments, loan_id)) == 1
+
+def test_db_apply_payment_invalidates_the_cached_loan(db):
+    loan_id = db.write_sync(_create, "Gus")
+    db.read_sync(get_cached_loans_page)
+    assert loan_id in loan_cache._entries
+    asyncio.run(db_apply_payment(loan_id, 10000, date(2026, 2, 1)))
+    assert loan_id not in loan_cache._entries
@@ -0,0 +1,32 @@
+import json
+import logging
+from datetime import date
+import metrics
+from csv_export import export_loans_csv
+from database import _add_loan
+from portfolio import _portfolio_summary
+
+LOANS = 25
+
+def _loans(conn):
+    for number in range(LOANS):
+        _add_loan(conn, f"M{number}", "7", "Operador", f"Cliente {number}", 100000, 20000, "2026-02-01", "Pendiente", 0, "2026-01-01")
+
+def _rows(operation):
+    return metrics.DB_ROWS._values.get((operation, "read"), 0)
+
+def test_full_scans_report_the_rows_they_read(db, monkeypatch, caplog):
+    db.write_sync(_loans)
+    monkeypatch.setattr(metrics, "SLOW_QUERY_MS", 0)
+    before = _rows("export_loans_csv"), _rows("portfolio_summary")
+    with caplog.at_level(logging.WARNING, logger="loanbot.slow_query"):
+        spool, rows, _ = db.read_sync(export_loans_csv)
+        spool.close()
+        db.read_sync(_portfolio_summary, date(2026, 3, 1))
+    assert rows == LOANS
+    assert _rows("export_loans_csv") - before[0] == LOANS
+    assert _rows("portfolio_summary") - before[1] == LOANS
+    logged = {entry["operation"]: entry for entry in map(json.loads, caplog.messages)}
+    assert logged["export_loans_csv"]["rows"] == LOANS
+    assert logged["portfolio_summary"]["rows"] == LOANS
+    assert "args" not in logged["export_loans_csv"]
@@ -0,0 +1,57 @@
+import random
+from datetime import date, timedelta
+from database import _add_loan
+from portfolio import _portfolio_summary, compute_balances, portfolio_from_loans
+
+AS_OF = (date(2026, 1, 1), date(2026, 3, 15), date(2027, 6, 30))
+
+def _loans(conn):
+    rng = random.Random(17)
+    base = date(2026, 1, 1)
+    fixed = (
+        # (estado, monto, pagado, capital, creación, vencimiento)
+        ("Pendiente", 100000, 0, 100000, None, None),
+        ("Pendiente", 100000, 0, 100000, "2026-02-01", "2026-03-01"),
+        ("Parcialmente Pagado", 33333, 50000, 1000, "2025-12-31", "2026-01-30"),
+        ("Pagado", 100000, 120000, 0, "2025-11-01", "2025-12-01"),
+        ("Pagado", 100000, 90000, 5000, "2025-11-01", None),
+    )
+    rows = list(fixed)
+    for _ in range(300):
+        amount = rng.randint(1, 5000000)
+        created = base + timedelta(days=rng.randint(-400, 400))
+        due = created + timedelta(days=rng.choice((0, 15, 30, 90)))
+        status = rng.choice(("Pendiente", "Parcialmente Pagado", "Pagado"))
+        rows.append((status, amount, rng.randint(0, amount * 2), rng.randint(0, amount), created.isoformat(), due.isoformat()))
+    for number, (status, amount, paid, capital, created, due) in enumerate(rows):
+        _add_loan(conn, f"T{number}", "7", "Operador", f"Cliente {number}", amount, None, due, status, paid, created)
+        conn.execute("UPDATE loans SET capital_cents = ? WHERE loan_id = ?", (capital, f"T{number}"))
+
+def _all_loans(conn):
+    return conn.execute("SELECT * FROM loans").fetchall()
+
+def _numpy_totals(loans, as_of):
+    portfolio = portfolio_from_loans(loans)
+    saldos = compute_balances(portfolio, as_of)
+    overdue = saldos["days_overdue"] > 0
+    return {
+        "loans": len(portfolio),
+        "open_loans": int(portfolio.is_open.sum()),
+        "capital_lent": int(portfolio.amount_cents.sum()),
+        "current_capital": int(portfolio.capital_cents[portfolio.is_open].sum()),
+        "paid": int(portfolio.paid_cents.sum()),
+        "accrued_interest": int(saldos["accrued_interest"].sum()),
+        "outstanding": int(saldos["balance"].sum()),
+        "overdue_loans": int(overdue.sum()),
+        "overdue_balance": int(saldos["balance"][overdue].sum()),
+    }
+
+def test_summary_sql_matches_compute_balances(db):
+    db.write_sync(_loans)
+    loans = db.read_sync(_all_loans)
+    for as_of in AS_OF:
+        assert db.read_sync(_portfolio_summary, as_of) == _numpy_totals(loans, as_of)
+
+def test_summary_of_an_empty_portfolio(db):
+    summary = db.read_sync(_portfolio_summary, AS_OF[0])
+    assert set(summary.values()) == {0}
@@ -0,0 +1,100 @@
+import gspread
+import pytest
+from types import SimpleNamespace
+from async_sheets import AsyncWorksheet
+from benchmarks.harness import FakeWorksheet
+from google_sheets_integration import HEADER, SheetRowIndex, SheetSyncQueue
+
+PAYMENT_DATE = HEADER.index('Fecha de Pago')
+AMORTIZED = HEADER.index('Monto Amortizado')
+BALANCE = HEADER.index('Saldo')
+STATUS = HEADER.index('Estatus')
+
+def _sheet(*rows):
+    return FakeWorksheet([HEADER, *rows])
+
+@pytest.fixture
+def make_queue():
+    queues = []
+
+    def make(worksheet, **kwargs):
+        queue = SheetSyncQueue(worksheet, SheetRowIndex().load(worksheet), **kwargs)
+        queues.append(queue)
+        return queue
+    yield make
+    for queue in queues:
+        queue.stop()
+
+def _api_error(status):
+    response = SimpleNamespace(json=lambda: {"error": {"code": status, "message": "", "status": ""}}, text="")
+    return gspread.exceptions.APIError(response)
+
+def test_payment_during_batch_update_is_not_overwritten(make_queue):
+    worksheet = _sheet(["L1", "2026-01-01", "Ana", 1000, 200, "", 0, 1200, "Impago"])
+    queue = make_queue(worksheet)
+    queue.update_loan("L1", "2026-02-01", 100)
+    worksheet.on_send = lambda: queue.update_loan("L1", "2026-03-01", 300)
+
+    assert queue.flush()
+    assert worksheet.rows[1][AMORTIZED] == 100
+    # El pago recibido durante el envío sigue en la caché y pendiente de enviar
+    assert queue.index.values["L1"][AMORTIZED] == 400
+    assert queue.index.values["L1"][BALANCE] == 800
+    assert queue.pending() == 1
+
+    assert queue.flush()
+    assert worksheet.rows[1][AMORTIZED] == 400
+    assert queue.pending() == 0
+
+def test_payment_during_append_is_sent_after_the_row_is_indexed(make_queue):
+    worksheet = _sheet()
+    queue = make_queue(worksheet)
+    queue.add_loan(["L2", "2026-01-01", "Beto", 500, 100, "", 0, 600, "Impago"])
+    worksheet.on_send = lambda: queue.update_loan("L2", "2026-02-01", 600)
+
+    assert queue.flush()
+    assert queue.index.rows["L2"] == 2
+    assert queue.index.values["L2"][STATUS] == "Pagado"
+
+    assert queue.flush()
+    assert worksheet.rows[1][AMORTIZED] == 600
+    assert worksheet.rows[1][STATUS] == "Pagado"
+    assert worksheet.calls == {"get_all_values": 1, "append_rows": 1, "batch_update": 1}
+
+def test_failed_batch_update_keeps_newer_changes(make_queue):
+    worksheet = _sheet(["L3", "2026-01-01", "Carla", 1000, 200, "", 0, 1200, "Impago"])
+    queue = make_queue(worksheet)
+    queue.update_loan("L3", "2026-02-01", 100)
+
+    def fail():
+        queue.update_loan("L3", "2026-03-01", 200)
+        raise RuntimeError("cuota agotada")
+    worksheet.on_send = fail
+
+    assert not queue.flush()
+    assert worksheet.rows[1][AMORTIZED] == 0
+    assert queue.flush()
+    assert worksheet.rows[1][AMORTIZED] == 300
+    assert worksheet.rows[1][PAYMENT_DATE] == "2026-03-01"
+
+def test_rate_limited_flush_is_retried_with_backoff(make_queue):
+    worksheet = _sheet(["L4", "2026-01-01", "Dan", 1000, 200, "", 0, 1200, "Impago"])
+    api = AsyncWorksheet(worksheet, base_delay=0.01, max_delay=0.02)
+    queue = make_queue(worksheet, api=api)
+    queue.update_loan("L4", "2026-02-01", 100)
+
+    def rate_limited():
+        raise _api_error(429)
+    worksheet.on_send = rate_limited
+
+    assert queue.flush()
+    assert worksheet.calls["batch_update"] == 2
+    assert worksheet.rows[1][AMORTIZED] == 100
+    assert queue.pending() == 0
+
+def test_stop_sends_what_is_queued(make_queue):
+    worksheet = _sheet(["L5", "2026-01-01", "Eva", 1000, 200, "", 0, 1200, "Impago"])
+    queue = make_queue(worksheet, flush_interval=3600).start()
+    queue.update_loan("L5", "2026-02-01", 1200)
+    queue.stop()
+    assert worksheet.rows[1][STATUS] == "Pagado"
@@ -0,0 +1,32 @@
+from datetime import date
+from amortization import format_date
+from benchmarks.harness import FakeWorksheet
+from database import _create_loan
+from google_sheets_integration import HEADER, SheetRowIndex, SheetSyncQueue
+from ledger import apply_payment
+from sheets_reconcile import reconcile
+
+PAYMENT_DATE = date(2026, 2, 1)
+
+def _loans(conn):
+    paid = _create_loan(conn, "7", "Operador", "Ana", 100000, 20000, "2026-02-01", "Pendiente", 0, "2026-01-01")
+    apply_payment(conn, paid, 30000, PAYMENT_DATE)
+    no_interest = _create_loan(conn, "7", "Operador", "Beto", 50000, None, None, "Pendiente", 0, "2026-01-01")
+    return paid, no_interest
+
+def test_rows_written_by_the_sync_queue_reconcile_cleanly(db):
+    loan_id, no_interest = db.write_sync(_loans)
+    worksheet = FakeWorksheet([HEADER])
+    queue = SheetSyncQueue(worksheet, SheetRowIndex().load(worksheet))
+    queue.add_loan([loan_id, format_date("2026-01-01"), "Ana", 1000.0, 200.0, "", 0, 1200.0, "Impago"])
+    queue.flush()
+    assert queue.update_loan(loan_id, format_date(PAYMENT_DATE), 300) == "Impago"
+    queue.stop()
+
+    changed_cells, missing_rows, extra_ids = reconcile(worksheet, dry_run=True)
+    assert changed_cells == []
+    assert extra_ids == []
+    assert [row[0] for row in missing_rows] == [no_interest]
+    # Sin interés la celda queda vacía, no con None
+    assert missing_rows[0][4] == ""
+    assert missing_rows[0][8] == "Impago"
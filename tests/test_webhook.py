@@ -0,0 +1,54 @@
+import asyncio
+from datetime import datetime
+from telegram import Chat, Message, Update
+from webhook import PerChatUpdateProcessor
+
+def _update(update_id, chat_id):
+    return Update(update_id, message=Message(update_id, datetime.now(), Chat(chat_id, Chat.PRIVATE)))
+
+async def _process(processor, updates, delays):
+    done, running = [], set()
+    peak = 0
+
+    async def handle(update):
+        nonlocal peak
+        running.add(update.update_id)
+        peak = max(peak, len(running))
+        await asyncio.sleep(delays[update.update_id])
+        running.discard(update.update_id)
+        done.append(update.update_id)
+
+    await asyncio.gather(*(processor.process_update(update, handle(update)) for update in updates))
+    return done, peak
+
+def test_same_chat_updates_finish_in_arrival_order():
+    processor = PerChatUpdateProcessor(workers=4)
+    # El primero es el más lento: sin el lock por chat terminaría el último
+    updates = [_update(1, 10), _update(2, 10), _update(3, 10)]
+    done, peak = asyncio.run(_process(processor, updates, {1: 0.05, 2: 0.01, 3: 0}))
+    assert done == [1, 2, 3]
+    assert peak == 1
+    assert processor._chat_locks == {}
+
+def test_different_chats_run_concurrently():
+    processor = PerChatUpdateProcessor(workers=4)
+    updates = [_update(1, 10), _update(2, 20), _update(3, 10), _update(4, 30)]
+    done, peak = asyncio.run(_process(processor, updates, {1: 0.05, 2: 0.02, 3: 0, 4: 0.01}))
+    assert done.index(1) < done.index(3)
+    assert done[0] == 4
+    assert peak == 3
+    assert processor._chat_locks == {}
+
+def test_waiting_chat_does_not_take_a_worker():
+    processor = PerChatUpdateProcessor(workers=2)
+    # 2 y 3 esperan a 1 en el mismo chat; 4 debe correr a la vez que 1 con el otro lugar
+    updates = [_update(1, 10), _update(2, 10), _update(3, 10), _update(4, 20)]
+    done, peak = asyncio.run(_process(processor, updates, {1: 0.05, 2: 0, 3: 0, 4: 0.01}))
+    assert done == [4, 1, 2, 3]
+    assert peak == 2
+
+def test_concurrency_limit_applies_across_chats():
+    processor = PerChatUpdateProcessor(workers=2)
+    updates = [_update(n, n) for n in range(1, 6)]
+    _, peak = asyncio.run(_process(processor, updates, {n: 0.01 for n in range(1, 6)}))
+    assert peak == 2
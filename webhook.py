@@ -0,0 +1,133 @@
+import asyncio
+import atexit
+import os
+import sys
+import threading
+from flask import Flask, request, abort
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '8'))
+# Para pruebas locales: no registrar el webhook en Telegram y solo aceptar POST
+WEBHOOK_SKIP_SET = os.getenv('WEBHOOK_SKIP_SET', '').lower() in ('1', 'true', 'yes')
+
+def _chat_key(update):
+    if update.effective_chat is not None:
+        return ("chat", update.effective_chat.id)
+    if update.effective_user is not None:
+        return ("user", update.effective_user.id)
+    return ("update", update.update_id)
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """
+    Processes up to `workers` updates at once while keeping updates of the same chat
+    strictly in arrival order, so ConversationHandler state stays consistent.
+    The per-chat lock is taken before a worker slot, so a busy chat cannot starve others.
+    """
+
+    def __init__(self, workers=WEBHOOK_WORKERS):
+        if workers < 1:
+            raise ValueError("workers must be a positive integer")
+        # process_update (final en PTB) toma el semáforo de la clase base antes de llamar a
+        # do_process_update; sin límite ahí, un update esperando a su chat no ocupa un lugar
+        super().__init__(sys.maxsize)
+        self.workers = workers
+        self._slots = asyncio.BoundedSemaphore(workers)
+        self._chat_locks = {}  # clave -> [asyncio.Lock, número de updates esperando]
+
+    async def do_process_update(self, update, coroutine):
+        key = _chat_key(update) if isinstance(update, Update) else ("other", id(update))
+        entry = self._chat_locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._slots:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._chat_locks[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+def create_app(application, loop):
+    """Flask app that hands each POSTed update to the bot's event loop and returns at once."""
+    app = Flask(__name__)
+
+    @app.post(WEBHOOK_PATH)
+    def telegram_webhook():
+        if WEBHOOK_SECRET and request.headers.get('X-Telegram-Bot-Api-Secret-Token') != WEBHOOK_SECRET:
+            abort(403)
+        data = request.get_json(silent=True)
+        if not data:
+            abort(400)
+        update = Update.de_json(data, application.bot)
+        asyncio.run_coroutine_threadsafe(application.update_queue.put(update), loop).result()
+        return "", 200
+
+    @app.get('/healthz')
+    def healthz():
+        return {"status": "ok", "pending_updates": application.update_queue.qsize()}
+
+    return app
+
+def start_bot_loop(application):
+    """Starts the application on an event loop running in a background thread."""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="loanbot-event-loop", daemon=True).start()
+
+    async def startup():
+        await application.initialize()
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        if not WEBHOOK_SKIP_SET:
+            await application.bot.set_webhook(
+                url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET, allowed_updates=Update.ALL_TYPES,
+            )
+
+    asyncio.run_coroutine_threadsafe(startup(), loop).result()
+    return loop
+
+def stop_bot_loop(application, loop):
+    async def shutdown():
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+    asyncio.run_coroutine_threadsafe(shutdown(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+
+def run_webhook(application):
+    """Runs the bot behind Flask's threaded server until Ctrl+C."""
+    loop = start_bot_loop(application)
+    try:
+        create_app(application, loop).run(host=WEBHOOK_LISTEN, port=WEBHOOK_PORT, threaded=True)
+    finally:
+        stop_bot_loop(application, loop)
+
+def create_wsgi_app():
+    """
+    Entry point for gunicorn. Use a single worker so per-chat ordering holds:
+    gunicorn -w 1 --threads 8 -b 0.0.0.0:8443 "webhook:create_wsgi_app()"
+    """
+    from main import build_application, init_db
+    from metrics import start_metrics_server
+    init_db()
+    application = build_application(webhook=True)
+    start_metrics_server()
+    loop = start_bot_loop(application)
+    atexit.register(stop_bot_loop, application, loop)
+    return create_app(application, loop)